@@ -0,0 +1,39 @@
+# src/core/api_transport.py
+import threading
+import logging
+from typing import Dict
+
+import anthropic
+
+logger = logging.getLogger(__name__)
+
+# One AsyncAnthropic per API key for the whole process. Each client owns a
+# keep-alive HTTP connection pool, so sharing it lets every ThorClient (CLI,
+# WebSocket bridge, swarm sessions) reuse warm connections.
+_clients: Dict[str, anthropic.AsyncAnthropic] = {}
+_clients_lock = threading.Lock()
+
+
+def get_async_client(api_key: str) -> anthropic.AsyncAnthropic:
+    """Get the shared async Anthropic client for an API key"""
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            # Retries are paced by ThorClient's rate limiter instead
+            client = anthropic.AsyncAnthropic(api_key=api_key, max_retries=0)
+            _clients[api_key] = client
+            logger.info("Created shared async Anthropic client")
+        return client
+
+
+async def close_async_clients():
+    """Close all shared clients and their connection pools"""
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+
+    for client in clients:
+        try:
+            await client.close()
+        except Exception as e:
+            logger.error(f"Error closing Anthropic client: {e}")
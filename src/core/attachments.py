@@ -0,0 +1,51 @@
+# src/core/attachments.py
+import hashlib
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+# Stored messages carry this reference in place of the file text
+ATTACHMENT_PATTERN = re.compile(r"\[\[attachment:([0-9a-f]{64}) (.+?)\]\]")
+
+
+def content_hash(content: str) -> str:
+    """Content address of an attachment"""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def attachment_ref(digest: str, path: str) -> str:
+    """Reference to a stored attachment, as it appears in a message"""
+    return f"[[attachment:{digest} {path}]]"
+
+
+def attachment_refs(content: Any) -> List[Tuple[str, str]]:
+    """(hash, path) of every attachment referenced in message content, in order"""
+    if isinstance(content, str):
+        return [(m.group(1), m.group(2)) for m in ATTACHMENT_PATTERN.finditer(content)]
+    if isinstance(content, list):
+        return [
+            ref for block in content if isinstance(block, dict) and block.get("type") == "text"
+            for ref in attachment_refs(block.get("text", ""))
+        ]
+    return []
+
+
+async def attach_files(memory_manager, message: str, attachments: List[Dict[str, Any]]) -> str:
+    """Store attached files once by content hash and reference them from message.
+
+    attachments are {"path": ...} dicts as sent by the UI. Files that
+    can't be read are reported inline, as before.
+    """
+    for attachment in attachments:
+        file_path = attachment.get("path", "")
+        if not file_path:
+            continue
+        try:
+            content = Path(file_path).read_text(encoding="utf-8")
+        except Exception as e:
+            message += f"\n\nError reading {file_path}: {str(e)}"
+            continue
+
+        digest = await memory_manager.save_attachment(file_path, content)
+        message += f"\n\n{attachment_ref(digest, file_path)}"
+    return message
@@ -0,0 +1,212 @@
+# src/core/batch_runner.py
+import asyncio
+import json
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import anthropic
+
+# Message Batches API limit on requests per batch
+MAX_BATCH_REQUESTS = 10000
+
+
+class BatchTransport(ABC):
+    """Where batches are submitted; swap in a fake for tests"""
+
+    @abstractmethod
+    async def create(self, requests: List[Dict[str, Any]]) -> str:
+        """Submit requests and return the batch id"""
+
+    @abstractmethod
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        """Return {"id", "status"}; status is "ended" once results are ready"""
+
+    @abstractmethod
+    def results(self, batch_id: str) -> AsyncIterator[Dict[str, Any]]:
+        """Yield {"custom_id", "type", "text", "usage", "error"} per request"""
+
+
+class AnthropicBatchTransport(BatchTransport):
+    """Message Batches API over the Anthropic SDK.
+
+    base_url points the SDK at another server, e.g. a local fake.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.client = anthropic.AsyncAnthropic(api_key=api_key, base_url=base_url)
+        # Older SDKs only ship batches under beta
+        self.batches = getattr(self.client.messages, "batches", None) or self.client.beta.messages.batches
+
+    async def create(self, requests: List[Dict[str, Any]]) -> str:
+        batch = await self.batches.create(requests=requests)
+        return batch.id
+
+    async def retrieve(self, batch_id: str) -> Dict[str, Any]:
+        batch = await self.batches.retrieve(batch_id)
+        return {"id": batch.id, "status": batch.processing_status}
+
+    async def results(self, batch_id: str) -> AsyncIterator[Dict[str, Any]]:
+        async for entry in await self.batches.results(batch_id):
+            result = entry.result
+            item = {"custom_id": entry.custom_id, "type": result.type}
+            if result.type == "succeeded":
+                message = result.message
+                item["text"] = "".join(block.text for block in message.content if block.type == "text")
+                item["usage"] = {
+                    key: getattr(message.usage, key, 0) or 0
+                    for key in ("input_tokens", "output_tokens",
+                                "cache_creation_input_tokens", "cache_read_input_tokens")
+                }
+            elif result.type == "errored":
+                item["error"] = str(getattr(result, "error", "unknown error"))
+            yield item
+
+    async def close(self):
+        await self.client.close()
+
+
+class BatchRunner:
+    """Submit a JSONL file of prompts as message batches and collect the results.
+
+    Progress is kept in a state file next to the input, so an interrupted
+    run picks up where it stopped: submitted batches are not resubmitted
+    and results already written are not written again.
+    """
+
+    def __init__(self, transport: BatchTransport, model_selector, system_prompt: str = "",
+                 default_model: str = "sonnet-4", max_tokens: int = 4000,
+                 poll_interval: float = 30.0, max_poll_interval: float = 600.0,
+                 memory_manager=None):
+        self.transport = transport
+        self.model_selector = model_selector
+        self.system_prompt = system_prompt
+        self.default_model = default_model
+        self.max_tokens = max_tokens
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.memory_manager = memory_manager
+        self.logger = logging.getLogger(__name__)
+
+    def load_prompts(self, input_path: Path) -> List[Dict[str, Any]]:
+        """Read prompts: one JSON object per line with "prompt" and optional
+        "custom_id", "model" (a model alias) and "max_tokens"
+        """
+        prompts = []
+        with open(input_path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if "prompt" not in entry:
+                    raise ValueError(f"{input_path}:{line_number}: missing 'prompt'")
+                entry.setdefault("custom_id", f"line-{line_number}")
+                entry.setdefault("model", self.default_model)
+                prompts.append(entry)
+        return prompts
+
+    def _build_request(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        model_config = self.model_selector.config.model_configs[entry["model"]]
+        params = {
+            "model": model_config.name,
+            "max_tokens": entry.get("max_tokens", self.max_tokens),
+            "messages": [{"role": "user", "content": entry["prompt"]}]
+        }
+        if self.system_prompt:
+            params["system"] = self.system_prompt
+        return {"custom_id": entry["custom_id"], "params": params}
+
+    def _load_state(self, state_path: Path) -> Dict[str, Any]:
+        if state_path.exists():
+            with open(state_path, 'r') as f:
+                return json.load(f)
+        return {"batches": []}
+
+    def _save_state(self, state_path: Path, state: Dict[str, Any]):
+        tmp_path = state_path.with_suffix(state_path.suffix + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, indent=2)
+        tmp_path.replace(state_path)
+
+    def _written_ids(self, output_path: Path) -> set:
+        if not output_path.exists():
+            return set()
+        with open(output_path, 'r', encoding='utf-8') as f:
+            return {json.loads(line)["custom_id"] for line in f if line.strip()}
+
+    async def run(self, input_path: str, output_path: str, state_path: Optional[str] = None) -> Dict[str, int]:
+        """Submit, poll and collect; returns counts by result type"""
+        input_path = Path(input_path)
+        output_path = Path(output_path)
+        state_path = Path(state_path) if state_path else input_path.with_suffix(input_path.suffix + '.batch_state.json')
+
+        state = self._load_state(state_path)
+        prompts = self.load_prompts(input_path)
+        prompt_text = {entry["custom_id"]: entry["prompt"] for entry in prompts}
+
+        # Submit anything not already in a batch from a previous run
+        submitted = {cid for batch in state["batches"] for cid in batch["models"]}
+        pending = [entry for entry in prompts if entry["custom_id"] not in submitted]
+        for start in range(0, len(pending), MAX_BATCH_REQUESTS):
+            chunk = pending[start:start + MAX_BATCH_REQUESTS]
+            batch_id = await self.transport.create([self._build_request(entry) for entry in chunk])
+            state["batches"].append({
+                "id": batch_id,
+                "models": {entry["custom_id"]: entry["model"] for entry in chunk},
+                "collected": False
+            })
+            self._save_state(state_path, state)
+            self.logger.info(f"Submitted batch {batch_id} ({len(chunk)} requests)")
+
+        counts: Dict[str, int] = {}
+        for batch in state["batches"]:
+            if batch["collected"]:
+                continue
+            await self._wait_for(batch["id"])
+            for result_type, count in (await self._collect(batch, output_path, prompt_text)).items():
+                counts[result_type] = counts.get(result_type, 0) + count
+            batch["collected"] = True
+            self._save_state(state_path, state)
+
+        return counts
+
+    async def _wait_for(self, batch_id: str):
+        """Poll with exponential backoff until the batch has ended"""
+        interval = self.poll_interval
+        while True:
+            status = (await self.transport.retrieve(batch_id))["status"]
+            if status == "ended":
+                return
+            self.logger.info(f"Batch {batch_id} is {status}; checking again in {interval:.0f}s")
+            await asyncio.sleep(interval)
+            interval = min(interval * 1.5, self.max_poll_interval)
+
+    async def _collect(self, batch: Dict[str, Any], output_path: Path,
+                       prompt_text: Dict[str, str]) -> Dict[str, int]:
+        """Append a batch's results to the output file and record their cost"""
+        written = self._written_ids(output_path)
+        counts: Dict[str, int] = {}
+
+        with open(output_path, 'a', encoding='utf-8') as f:
+            async for item in self.transport.results(batch["id"]):
+                counts[item["type"]] = counts.get(item["type"], 0) + 1
+                if item["custom_id"] in written:
+                    continue
+
+                model_name = batch["models"].get(item["custom_id"], self.default_model)
+                usage = item.get("usage")
+                if usage:
+                    input_cost, output_cost = self.model_selector.cost_breakdown(model_name, usage, batch=True)
+                    item["cost"] = input_cost + output_cost
+                    self.model_selector.update_usage(item["cost"], usage)
+                    if self.memory_manager:
+                        await self.memory_manager.add_to_conversation(
+                            f"batch-{batch['id']}", prompt_text.get(item["custom_id"], ""), item.get("text", ""),
+                            usage=usage, costs=(input_cost, output_cost)
+                        )
+
+                f.write(json.dumps({"batch_id": batch["id"], **item}) + "\n")
+                f.flush()
+
+        return counts
@@ -2,7 +2,7 @@
 import os
 import json
 from typing import Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
 from pathlib import Path
 import logging
 
@@ -14,6 +14,9 @@ class ModelConfig:
     max_tokens: int
     best_for: list
     daily_limit: float = 5.0  # $5/month = ~$0.17/day
+    input_cost_per_1k: Optional[float] = None  # falls back to cost_per_1k_tokens
+    output_cost_per_1k: Optional[float] = None
+    context_budget: Optional[int] = None  # input tokens per request; defaults to max_tokens
 
     def to_dict(self) -> Dict[str, Any]:
         return asdict(self)
@@ -28,7 +31,35 @@ class ThorConfig:
     argus_path: Optional[str] = None
     log_level: str = "INFO"
     chat_memory_limit: int = 50
+    session_cache_bytes: int = 32 * 1024 * 1024  # resident conversation history across sessions
     artifact_memory_limit: int = 100
+    max_agent_steps: int = 8
+    response_cache_enabled: bool = False
+    response_cache_ttl: int = 86400  # seconds
+    response_cache_max_bytes: int = 50 * 1024 * 1024
+    request_coalescing: bool = True
+    api_rate_limit: int = 100  # requests per minute, per model
+    api_token_rate_limit: int = 400000  # input tokens per minute, per model
+    max_parallel_tasks: int = 5  # ceiling of the adaptive concurrency window
+    max_retries: int = 4
+    cascade_enabled: bool = False
+    cascade_model: str = "haiku-4"  # answers first; escalates to the task's model
+    cascade_confidence_threshold: float = 0.7
+    cascade_max_tool_calls: int = 2  # more planned tool calls than this escalates
+    latency_slos: Dict[str, float] = field(default_factory=dict)  # task type -> p95 seconds
+    failover_error_rate: float = 0.5  # recent error rate that takes a model out of rotation
+    hedging_enabled: bool = False
+    hedge_percentile: float = 95  # time-to-first-token percentile that triggers a hedge
+    hedge_max_fraction: float = 0.1  # cap on hedged share of requests
+    metrics_host: str = "localhost"
+    metrics_port: Optional[int] = None  # serve Prometheus /metrics when set
+    metrics_dump_path: Optional[str] = None  # append spans as JSON lines when set
+    tool_output_limit: int = 16000  # characters; longer tool results are spilled to artifacts
+    db_readers: int = 2  # read-only connections to thor_memory.db
+    db_synchronous: str = "NORMAL"  # SQLite synchronous pragma: OFF, NORMAL or FULL
+    db_busy_timeout_ms: int = 5000  # wait this long for another process's write lock
+    memory_flush_interval: float = 1.0  # seconds conversation writes may wait; 0 writes each turn through
+    memory_flush_rows: int = 64  # flush sooner once this many rows are waiting
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -37,7 +68,35 @@ class ThorConfig:
             'argus_path': self.argus_path,
             'log_level': self.log_level,
             'chat_memory_limit': self.chat_memory_limit,
-            'artifact_memory_limit': self.artifact_memory_limit
+            'session_cache_bytes': self.session_cache_bytes,
+            'artifact_memory_limit': self.artifact_memory_limit,
+            'max_agent_steps': self.max_agent_steps,
+            'response_cache_enabled': self.response_cache_enabled,
+            'response_cache_ttl': self.response_cache_ttl,
+            'response_cache_max_bytes': self.response_cache_max_bytes,
+            'request_coalescing': self.request_coalescing,
+            'api_rate_limit': self.api_rate_limit,
+            'api_token_rate_limit': self.api_token_rate_limit,
+            'max_parallel_tasks': self.max_parallel_tasks,
+            'max_retries': self.max_retries,
+            'cascade_enabled': self.cascade_enabled,
+            'cascade_model': self.cascade_model,
+            'cascade_confidence_threshold': self.cascade_confidence_threshold,
+            'cascade_max_tool_calls': self.cascade_max_tool_calls,
+            'latency_slos': self.latency_slos,
+            'failover_error_rate': self.failover_error_rate,
+            'hedging_enabled': self.hedging_enabled,
+            'hedge_percentile': self.hedge_percentile,
+            'hedge_max_fraction': self.hedge_max_fraction,
+            'metrics_host': self.metrics_host,
+            'metrics_port': self.metrics_port,
+            'metrics_dump_path': self.metrics_dump_path,
+            'tool_output_limit': self.tool_output_limit,
+            'db_readers': self.db_readers,
+            'db_synchronous': self.db_synchronous,
+            'db_busy_timeout_ms': self.db_busy_timeout_ms,
+            'memory_flush_interval': self.memory_flush_interval,
+            'memory_flush_rows': self.memory_flush_rows
         }
 
 class ConfigManager:
@@ -55,19 +114,25 @@ class ConfigManager:
                 name="claude-3-5-sonnet-20241022",
                 cost_per_1k_tokens=0.003,
                 max_tokens=200000,
-                best_for=["coding", "debugging", "implementation", "quick_fix", "general"]
+                best_for=["coding", "debugging", "implementation", "quick_fix", "general"],
+                input_cost_per_1k=0.003,
+                output_cost_per_1k=0.015
             ),
             "opus-4": ModelConfig(
                 name="claude-3-opus-20240229",
                 cost_per_1k_tokens=0.015,
                 max_tokens=200000,
-                best_for=["architecture", "security_audit", "complex_analysis"]
+                best_for=["architecture", "security_audit", "complex_analysis"],
+                input_cost_per_1k=0.015,
+                output_cost_per_1k=0.075
             ),
             "haiku-4": ModelConfig(
                 name="claude-3-haiku-20240307",
                 cost_per_1k_tokens=0.00025,
                 max_tokens=200000,
-                best_for=["simple_tasks", "quick_responses"]
+                best_for=["simple_tasks", "quick_responses"],
+                input_cost_per_1k=0.00025,
+                output_cost_per_1k=0.00125
             )
         }
         
@@ -83,7 +148,35 @@ class ConfigManager:
                         argus_path=data.get('argus_path', os.getenv('ARGUS_PATH')),
                         log_level=data.get('log_level', 'INFO'),
                         chat_memory_limit=data.get('chat_memory_limit', 50),
-                        artifact_memory_limit=data.get('artifact_memory_limit', 100)
+                        session_cache_bytes=data.get('session_cache_bytes', 32 * 1024 * 1024),
+                        artifact_memory_limit=data.get('artifact_memory_limit', 100),
+                        max_agent_steps=data.get('max_agent_steps', 8),
+                        response_cache_enabled=data.get('response_cache_enabled', False),
+                        response_cache_ttl=data.get('response_cache_ttl', 86400),
+                        response_cache_max_bytes=data.get('response_cache_max_bytes', 50 * 1024 * 1024),
+                        request_coalescing=data.get('request_coalescing', True),
+                        api_rate_limit=data.get('api_rate_limit', 100),
+                        api_token_rate_limit=data.get('api_token_rate_limit', 400000),
+                        max_parallel_tasks=data.get('max_parallel_tasks', 5),
+                        max_retries=data.get('max_retries', 4),
+                        cascade_enabled=data.get('cascade_enabled', False),
+                        cascade_model=data.get('cascade_model', 'haiku-4'),
+                        cascade_confidence_threshold=data.get('cascade_confidence_threshold', 0.7),
+                        cascade_max_tool_calls=data.get('cascade_max_tool_calls', 2),
+                        latency_slos=data.get('latency_slos', {}),
+                        failover_error_rate=data.get('failover_error_rate', 0.5),
+                        hedging_enabled=data.get('hedging_enabled', False),
+                        hedge_percentile=data.get('hedge_percentile', 95),
+                        hedge_max_fraction=data.get('hedge_max_fraction', 0.1),
+                        metrics_host=data.get('metrics_host', 'localhost'),
+                        metrics_port=data.get('metrics_port'),
+                        metrics_dump_path=data.get('metrics_dump_path'),
+                        tool_output_limit=data.get('tool_output_limit', 16000),
+                        db_readers=data.get('db_readers', 2),
+                        db_synchronous=data.get('db_synchronous', "NORMAL"),
+                        db_busy_timeout_ms=data.get('db_busy_timeout_ms', 5000),
+                        memory_flush_interval=data.get('memory_flush_interval', 1.0),
+                        memory_flush_rows=data.get('memory_flush_rows', 64)
                     )
             except Exception as e:
                 print(f"Error loading config: {e}, using defaults")
@@ -0,0 +1,150 @@
+# src/core/context_builder.py
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from .attachments import ATTACHMENT_PATTERN, attachment_refs
+
+# Rough tokenizer-free estimate; good enough for budgeting, not billing
+CHARS_PER_TOKEN = 4
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(content: Any) -> int:
+    """Estimate the token count of message content"""
+    if isinstance(content, str):
+        text = content
+    elif isinstance(content, list):
+        text = "".join(
+            block.get("text", "") if block.get("type") == "text" else json.dumps(block, default=str)
+            for block in content
+        )
+    else:
+        text = json.dumps(content, default=str)
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+class ContextBuilder:
+    """Fill a per-model token budget with conversation history, newest first"""
+
+    def __init__(self, reserved_tokens: int = 0):
+        # Tokens held back for the system prompt, tools and model output
+        self.reserved_tokens = reserved_tokens
+        self.logger = logging.getLogger(__name__)
+
+    def budget_for(self, model_config) -> int:
+        """Input token budget for a model"""
+        budget = getattr(model_config, "context_budget", None) or model_config.max_tokens
+        budget = min(budget, model_config.max_tokens)
+        return max(budget - self.reserved_tokens, 0)
+
+    def build(self, history: List[Dict], message: Any, model_config,
+              budget: Optional[int] = None, attachments: Optional[Dict[str, str]] = None) -> List[Dict]:
+        """Build API messages from history plus the new user message.
+
+        Messages are taken newest to oldest until the budget is spent. The
+        new message and any history entry marked "pinned" are always kept.
+        The result starts with a user message and alternates roles.
+
+        Attachment references are expanded from attachments (content by
+        hash): each file version at most once, at its newest mention, and
+        versions superseded by a newer one of the same path are elided.
+        """
+        if budget is None:
+            budget = self.budget_for(model_config)
+
+        attachments = attachments or {}
+        plan = self._plan_attachments([msg["content"] for msg in history] + [message])
+        history = [
+            {**msg, "content": self._expand(msg["content"], index, plan, attachments)}
+            for index, msg in enumerate(history)
+        ]
+        message = self._expand(message, len(history), plan, attachments)
+
+        new_message = {"role": "user", "content": message}
+        sizes = [estimate_tokens(msg["content"]) + MESSAGE_OVERHEAD_TOKENS for msg in history]
+        used = estimate_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+        used += sum(size for msg, size in zip(history, sizes) if msg.get("pinned"))
+
+        keep = [bool(msg.get("pinned")) for msg in history]
+        for index in range(len(history) - 1, -1, -1):
+            if keep[index]:
+                continue
+            if used + sizes[index] > budget:
+                break
+            keep[index] = True
+            used += sizes[index]
+
+        if used > budget:
+            self.logger.warning(f"Pinned context ({used} tokens) exceeds budget ({budget} tokens)")
+
+        selected = [
+            {"role": msg["role"], "content": msg["content"]}
+            for msg, kept in zip(history, keep) if kept
+        ]
+        return self._normalize(selected + [new_message])
+
+    def _plan_attachments(self, contents: List[Any]) -> Dict[Tuple[str, str], Any]:
+        """Decide how each attachment reference renders.
+
+        Maps (hash, path) to the message index where that version is
+        expanded, or to None when a newer version of the path supersedes it.
+        """
+        plan: Dict[Tuple[str, str], Any] = {}
+        latest: Dict[str, str] = {}
+        for index in range(len(contents) - 1, -1, -1):
+            for digest, path in attachment_refs(contents[index]):
+                latest.setdefault(path, digest)
+                if (digest, path) not in plan:
+                    plan[(digest, path)] = index if latest[path] == digest else None
+        return plan
+
+    def _expand(self, content: Any, index: int, plan: Dict[Tuple[str, str], Any],
+                attachments: Dict[str, str]) -> Any:
+        if isinstance(content, list):
+            return [
+                {**block, "text": self._expand(block["text"], index, plan, attachments)}
+                if isinstance(block, dict) and block.get("type") == "text" else block
+                for block in content
+            ]
+        if not isinstance(content, str) or "[[attachment:" not in content:
+            return content
+
+        def render(match) -> str:
+            digest, path = match.group(1), match.group(2)
+            target = plan.get((digest, path))
+            if target is None:
+                return f"File: {path} (older version elided; the current version is attached later)"
+            if target != index:
+                return f"File: {path} (unchanged; attached again later)"
+            if digest not in attachments:
+                return f"File: {path} (attachment {digest[:12]} not found)"
+            return f"File: {path}\n```\n{attachments[digest]}\n```"
+
+        return ATTACHMENT_PATTERN.sub(render, content)
+
+    def _normalize(self, messages: List[Dict]) -> List[Dict]:
+        """Merge same-role neighbours and drop leading assistant turns"""
+        normalized: List[Dict] = []
+        for msg in messages:
+            if normalized and normalized[-1]["role"] == msg["role"]:
+                normalized[-1] = {
+                    "role": msg["role"],
+                    "content": self._merge_content(normalized[-1]["content"], msg["content"])
+                }
+            else:
+                normalized.append(msg)
+
+        while normalized and normalized[0]["role"] != "user":
+            normalized.pop(0)
+        return normalized
+
+    def _merge_content(self, first: Any, second: Any) -> Any:
+        if isinstance(first, str) and isinstance(second, str):
+            return f"{first}\n\n{second}"
+        return self._as_blocks(first) + self._as_blocks(second)
+
+    def _as_blocks(self, content: Any) -> List[Dict]:
+        if isinstance(content, str):
+            return [{"type": "text", "text": content}]
+        return list(content)
@@ -1,5 +1,9 @@
 # src/core/file_operations.py
 import os
+import mmap
+import codecs
+import signal
+import asyncio
 import subprocess
 import json
 import logging
@@ -8,6 +12,12 @@ from pathlib import Path
 import fnmatch
 import ast
 
+# Largest page read_file returns at once (~16k tokens)
+DEFAULT_PAGE_BYTES = 64 * 1024
+
+# Files bigger than this are memory-mapped rather than read into memory
+MMAP_THRESHOLD = 1024 * 1024
+
 class FileOperations:
     """Enhanced file operations with security and best practices"""
     
@@ -19,8 +29,16 @@ class FileOperations:
             'node', 'java', 'javac', 'gcc', 'make', 'cmake', 'curl', 'wget'
         }
     
-    def read_file(self, file_path: str) -> str:
-        """Read file with comprehensive error handling"""
+    def read_file(self, file_path: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                  start_byte: Optional[int] = None, end_byte: Optional[int] = None,
+                  cursor: Optional[str] = None, page_bytes: int = DEFAULT_PAGE_BYTES) -> str:
+        """Read a file, or one page of it.
+        
+        Small files read without a range come back verbatim. Otherwise a
+        page of at most page_bytes is returned for the requested lines
+        (1-based, inclusive) or bytes (end exclusive), followed by a footer
+        with a cursor for the next page. Large files are memory-mapped.
+        """
         try:
             path = Path(file_path)
             if not path.exists():
@@ -29,27 +47,152 @@ class FileOperations:
             if not path.is_file():
                 return f"❌ Path is not a file: {file_path}"
             
-            # Check file size (max 10MB)
-            if path.stat().st_size > 10 * 1024 * 1024:
-                return f"❌ File too large (>10MB): {file_path}"
-            
-            with open(path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            line_offset = resume = None
+            if cursor:
+                try:
+                    unit, start, end, line_offset, resume = self._parse_cursor(cursor)
+                except ValueError:
+                    return f"❌ Invalid cursor: {cursor}"
+                if unit == "line":
+                    start_line, end_line, start_byte, end_byte = start, end, None, None
+                else:
+                    start_line, end_line, start_byte, end_byte = None, None, start, end
+            
+            by_line = start_line is not None or end_line is not None
+            if by_line and (start_byte is not None or end_byte is not None):
+                return "❌ Give either a line range or a byte range, not both"
+            
+            size = path.stat().st_size
+            with open(path, 'rb') as f:
+                if size == 0:
+                    return ""
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size > MMAP_THRESHOLD else f.read()
+                try:
+                    if by_line:
+                        content = self._read_lines(data, path, size, start_line or 1, end_line, page_bytes,
+                                                   line_offset)
+                    elif start_byte is None and end_byte is None and size <= page_bytes:
+                        content = self._decode(data[:size])[0]
+                    else:
+                        content = self._read_bytes(data, path, size, start_byte or 0, end_byte, page_bytes,
+                                                   resume)
+                finally:
+                    if isinstance(data, mmap.mmap):
+                        data.close()
             
             self.logger.info(f"Read file: {file_path}")
             return content
             
-        except UnicodeDecodeError:
-            try:
-                with open(path, 'r', encoding='latin-1') as f:
-                    content = f.read()
-                return content
-            except Exception as e:
-                return f"❌ Error reading file (binary?): {str(e)}"
         except Exception as e:
             self.logger.error(f"Error reading file {file_path}: {e}")
             return f"❌ Error reading file: {str(e)}"
     
+    def _decode(self, raw: bytes) -> tuple:
+        """Decode bytes read once: UTF-8 (BOM stripped), else latin-1"""
+        if raw.startswith(codecs.BOM_UTF8):
+            raw = raw[len(codecs.BOM_UTF8):]
+        try:
+            return raw.decode('utf-8'), 'utf-8'
+        except UnicodeDecodeError:
+            return raw.decode('latin-1'), 'latin-1'
+    
+    def _read_lines(self, data, path: Path, size: int, start_line: int, end_line: Optional[int],
+                    page_bytes: int, start_offset: Optional[int] = None) -> str:
+        """A page of whole lines from start_line, up to end_line.
+        
+        start_offset is where start_line begins, as carried by a cursor, so
+        following cursors doesn't rescan the file from the top every page.
+        """
+        if start_line < 1 or (end_line is not None and end_line < start_line):
+            return f"❌ Invalid line range: {start_line}-{end_line}"
+        
+        if start_offset is not None and 0 < start_offset < size and data[start_offset - 1] == 0x0A:
+            start = start_offset
+        else:
+            # Skip to the first line without copying what comes before it
+            start = 0
+            for _ in range(start_line - 1):
+                newline = data.find(b"\n", start)
+                if newline == -1:
+                    return f"❌ {path} has fewer than {start_line} lines"
+                start = newline + 1
+        if start >= size:
+            return f"❌ {path} has fewer than {start_line} lines"
+        
+        end, line = start, start_line
+        while end < size and (end_line is None or line <= end_line):
+            newline = data.find(b"\n", end)
+            line_end = size if newline == -1 else newline + 1
+            if line_end - start > page_bytes:
+                if end == start:
+                    # One line longer than a page: continue by bytes instead,
+                    # then back to lines after it
+                    resume = None
+                    if line_end < size and (end_line is None or line < end_line):
+                        resume = f"line:{line + 1}" + (f"-{end_line}" if end_line is not None else "")
+                        resume += f"@{line_end}"
+                    return self._read_bytes(data, path, size, start, line_end, page_bytes, resume)
+                break
+            end, line = line_end, line + 1
+        
+        content, encoding = self._decode(data[start:end])
+        more = end < size and (end_line is None or line <= end_line)
+        next_cursor = f"line:{line}-{end_line}" if end_line is not None else f"line:{line}"
+        next_cursor += f"@{end}"
+        return content + self._page_footer(f"lines {start_line}-{line - 1}", path, size, encoding,
+                                           next_cursor if more else None)
+    
+    def _read_bytes(self, data, path: Path, size: int, start: int, end: Optional[int],
+                    page_bytes: int, resume: Optional[str] = None) -> str:
+        """A page of bytes from start, never splitting a UTF-8 character.
+        
+        resume is the cursor to continue with once the range is done.
+        """
+        if start < 0 or start >= size or (end is not None and end <= start):
+            return f"❌ Invalid byte range: {start}-{end} (file is {size} bytes)"
+        
+        limit = size if end is None else min(end, size)
+        stop = min(limit, start + page_bytes)
+        # Align to UTF-8 character boundaries (at most 3 continuation bytes, 10xxxxxx)
+        for _ in range(3):
+            if start < stop and data[start] & 0xC0 == 0x80:
+                start += 1
+        for _ in range(3):
+            if stop < size and stop - 1 > start and data[stop] & 0xC0 == 0x80:
+                stop -= 1
+        
+        content, encoding = self._decode(data[start:stop])
+        if stop >= limit:
+            next_cursor = resume
+        elif end is None:
+            next_cursor = f"byte:{stop}"
+        else:
+            next_cursor = f"byte:{stop}-{end}" + (f">{resume}" if resume else "")
+        return content + self._page_footer(f"bytes {start}-{stop}", path, size, encoding, next_cursor)
+    
+    def _page_footer(self, span: str, path: Path, size: int, encoding: str,
+                     next_cursor: Optional[str]) -> str:
+        footer = f"\n\n[{span} of {path} ({size} bytes"
+        if encoding != 'utf-8':
+            footer += f", decoded as {encoding}"
+        footer += ")"
+        if next_cursor:
+            footer += f"; more with cursor=\"{next_cursor}\""
+        return footer + "]"
+    
+    def _parse_cursor(self, cursor: str) -> tuple:
+        """Cursor "line:<start>[-<end>][@<offset>]" or "byte:<start>[-<end>][><line cursor>]"
+        -> (unit, start, end, offset, resume)"""
+        cursor, _, resume = cursor.partition(">")
+        if resume and (cursor.startswith("line:") or self._parse_cursor(resume)[0] != "line"):
+            raise ValueError(cursor)
+        unit, _, span = cursor.partition(":")
+        span, _, offset = span.partition("@")
+        if unit not in ("line", "byte") or not span or (offset and unit != "line"):
+            raise ValueError(cursor)
+        start, _, end = span.partition("-")
+        return unit, int(start), int(end) if end else None, int(offset) if offset else None, resume or None
+    
     def write_file(self, file_path: str, content: str) -> str:
         """Write file with backup and safety checks"""
         try:
@@ -113,17 +256,24 @@ class FileOperations:
             self.logger.error(f"Error creating directory {directory_path}: {e}")
             return f"❌ Error creating directory: {str(e)}"
     
+    def _check_command(self, command: str) -> Optional[str]:
+        """Return an error message if command isn't allowed to run"""
+        cmd_parts = command.split()
+        if not cmd_parts:
+            return "❌ Empty command"
+        
+        base_command = cmd_parts[0]
+        if base_command not in self.safe_commands:
+            return f"❌ Command not allowed for security: {base_command}"
+        return None
+    
     def run_command(self, command: str) -> str:
         """Run command with security restrictions"""
         try:
             # Security check
-            cmd_parts = command.split()
-            if not cmd_parts:
-                return "❌ Empty command"
-            
-            base_command = cmd_parts[0]
-            if base_command not in self.safe_commands:
-                return f"❌ Command not allowed for security: {base_command}"
+            error = self._check_command(command)
+            if error:
+                return error
             
             # Run command with timeout
             result = subprocess.run(
@@ -148,6 +298,58 @@ class FileOperations:
             self.logger.error(f"Error running command {command}: {e}")
             return f"❌ Error running command: {str(e)}"
     
+    async def run_command_async(self, command: str, timeout: float = 30) -> str:
+        """Run command without blocking the event loop.
+        
+        The command gets its own process group; if the caller is cancelled
+        or the timeout hits, the whole group is killed so nothing is orphaned.
+        """
+        error = self._check_command(command)
+        if error:
+            return error
+        
+        try:
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=os.getcwd(),
+                start_new_session=(os.name == 'posix')
+            )
+        except Exception as e:
+            self.logger.error(f"Error running command {command}: {e}")
+            return f"❌ Error running command: {str(e)}"
+        
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            await self._kill_process_group(process)
+            return f"❌ Command timeout ({timeout:g} seconds)"
+        except asyncio.CancelledError:
+            await self._kill_process_group(process)
+            self.logger.info(f"Cancelled command: {command}")
+            raise
+        
+        output = stdout.decode('utf-8', errors='replace')
+        if stderr:
+            output += f"\n❌ Error: {stderr.decode('utf-8', errors='replace')}"
+        
+        self.logger.info(f"Executed command: {command}")
+        return output or "✅ Command executed successfully (no output)"
+    
+    async def _kill_process_group(self, process):
+        """Kill a command and everything it started"""
+        if process.returncode is not None:
+            return
+        try:
+            if os.name == 'posix':
+                os.killpg(process.pid, signal.SIGKILL)
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+    
     def search_files(self, pattern: str, directory: str = ".") -> str:
         """Search files for pattern with advanced options"""
         try:
@@ -182,11 +384,15 @@ class FileOperations:
     def analyze_code(self, file_path: str) -> str:
         """Analyze code file for best practices and issues"""
         try:
-            content = self.read_file(file_path)
-            if content.startswith("❌"):
-                return content
-            
             path = Path(file_path)
+            if not path.exists():
+                return f"❌ File not found: {file_path}"
+            
+            if not path.is_file():
+                return f"❌ Path is not a file: {file_path}"
+            
+            # The whole file; paging is only for what the model reads
+            content = self._decode(path.read_bytes())[0]
             analysis = {
                 "file": file_path,
                 "size": len(content),
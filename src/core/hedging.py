@@ -0,0 +1,112 @@
+# src/core/hedging.py
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from .model_telemetry import MIN_SAMPLES, percentile
+
+logger = logging.getLogger(__name__)
+
+# Never hedge sooner than this, however fast the model usually is
+MIN_HEDGE_DELAY = 0.25
+
+_DONE = object()
+
+
+class HedgePolicy:
+    """When to send a backup request, and a tally of what hedging cost and won.
+
+    A request that hasn't produced its first event within the given
+    percentile of recent time-to-first-token gets a duplicate, as long as
+    hedges stay under max_fraction of all requests.
+    """
+
+    def __init__(self, hedge_percentile: float = 95, max_fraction: float = 0.1):
+        self.hedge_percentile = hedge_percentile
+        self.max_fraction = max_fraction
+        self.requests = 0
+        self.launched = 0
+        self.won = 0
+        self.extra_cost = 0.0
+
+    def delay(self, first_token_samples: List[float]) -> Optional[float]:
+        """Seconds to wait before hedging, or None without enough history"""
+        if len(first_token_samples) < MIN_SAMPLES:
+            return None
+        return max(MIN_HEDGE_DELAY, percentile(first_token_samples, self.hedge_percentile))
+
+    def allow(self) -> bool:
+        """Whether one more hedge stays within the traffic cap"""
+        return self.launched + 1 <= self.max_fraction * self.requests
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "hedges_launched": self.launched,
+            "hedges_won": self.won,
+            "hedged_fraction": self.launched / self.requests if self.requests else 0.0,
+            "extra_cost": self.extra_cost
+        }
+
+    async def race(self, factory: Callable[[], AsyncIterator[Any]], delay: Optional[float],
+                   on_loser: Optional[Callable[[], float]] = None) -> AsyncIterator[Any]:
+        """Stream from factory(), hedging with a second call if it's slow to start.
+
+        Whichever call produces an event first is streamed to the end and
+        the other is cancelled. on_loser is called once for the cancelled
+        call and returns what it cost, which is added to extra_cost.
+        """
+        self.requests += 1
+        if delay is None:
+            async for event in factory():
+                yield event
+            return
+
+        queues: List[asyncio.Queue] = []
+        pumps: List[asyncio.Task] = []
+
+        def launch():
+            queue: asyncio.Queue = asyncio.Queue()
+
+            async def pump():
+                try:
+                    async for event in factory():
+                        await queue.put(event)
+                finally:
+                    queue.put_nowait(_DONE)
+
+            queues.append(queue)
+            pumps.append(asyncio.ensure_future(pump()))
+
+        launch()
+        winner = 0
+        getters: List[asyncio.Future] = []
+        try:
+            first = asyncio.ensure_future(queues[0].get())
+            getters.append(first)
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if not done and self.allow():
+                self.launched += 1
+                logger.info(f"No first token after {delay:.2f}s; sending a hedged request")
+                launch()
+                backup = asyncio.ensure_future(queues[1].get())
+                getters.append(backup)
+                done, _ = await asyncio.wait({first, backup}, return_when=asyncio.FIRST_COMPLETED)
+                if first not in done:
+                    winner = 1
+                    self.won += 1
+                    first.cancel()
+                    first = backup
+                else:
+                    backup.cancel()
+                pumps[1 - winner].cancel()
+                if on_loser:
+                    self.extra_cost += on_loser()
+
+            event = await first
+            while event is not _DONE:
+                yield event
+                event = await queues[winner].get()
+        finally:
+            for future in getters + pumps:
+                future.cancel()
@@ -1,170 +1,322 @@
 # src/core/memory_manager.py - CORRECTED VERSION
 import json
-import sqlite3
+import re
+import sys
 import asyncio
 import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
 from typing import Dict, List, Optional, Any
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from .attachments import content_hash
+from .memory_schema import MIGRATIONS
+from .storage import Database, open_database
+
+# Sessions older than this start over with an empty history
+HISTORY_MAX_AGE_DAYS = 7
+
+# Updating in place keeps an artifact's id and created_at, and its search index entry
+UPSERT_ARTIFACT = """
+    INSERT INTO artifacts (name, content, category, updated_at) VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO UPDATE SET
+        content = excluded.content, category = excluded.category, updated_at = excluded.updated_at
+"""
+
+# Longest search snippet, in tokens
+SNIPPET_TOKENS = 16
+
+# Artifact writes made by the running chat turn, as (name, previous row or None)
+_turn_journal: ContextVar[Optional[list]] = ContextVar("thor_turn_journal", default=None)
+
 class MemoryManager:
     """Advanced memory management for conversations and artifacts"""
     
     def __init__(self, config_manager):
         self.config = config_manager.config
         self.db_path = Path("thor_memory.db")
+        self.db: Optional[Database] = None
         self.logger = logging.getLogger(__name__)
-        self.conversation_cache = {}
+        # Resident session histories, least recently used first
+        self.conversation_cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self.session_bytes: Dict[str, int] = {}
         self.artifact_cache = {}
+        # Conversation rows written behind: queued here, flushed in batches
+        self._pending: List[tuple] = []
+        self._unflushed: Dict[str, int] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_due: Optional[asyncio.Event] = None
         
     async def initialize_db(self):
-        """Initialize SQLite database for memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Conversations table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS conversations (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT NOT NULL,
-                role TEXT NOT NULL,
-                content TEXT NOT NULL,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                tokens INTEGER DEFAULT 0,
-                cost REAL DEFAULT 0.0
-            )
-        """)
-        
-        # Artifacts table
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS artifacts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL UNIQUE,
-                content TEXT NOT NULL,
-                category TEXT DEFAULT 'general',
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                access_count INTEGER DEFAULT 0
-            )
-        """)
-        
-        conn.commit()
-        conn.close()
+        """Open the shared connections to the memory database and bring its schema up to date"""
+        self.db = await open_database(
+            self.db_path,
+            readers=self.config.db_readers,
+            synchronous=self.config.db_synchronous,
+            busy_timeout_ms=self.config.db_busy_timeout_ms
+        )
+        
+        await self.db.migrate(MIGRATIONS)
+        self.db.on_close(self.flush)
     
     async def load_memory(self):
-        """Load memory from database"""
+        """Open the memory database; session histories are loaded on first use"""
         await self.initialize_db()
+    
+    async def _session(self, session_id: str) -> List[Dict]:
+        """A session's recent history, loading it into the cache if it isn't resident"""
+        if session_id in self.conversation_cache:
+            self.conversation_cache.move_to_end(session_id)
+            return self.conversation_cache[session_id]
         
-        # Load recent conversations into cache
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT session_id, role, content, timestamp 
+        # The newest recent messages (newest first, so the index stops after
+        # the limit) plus pinned ones, which are exempt from the age cutoff
+        max_age = f"-{HISTORY_MAX_AGE_DAYS} days"
+        rows = await self.db.fetchall("""
+            SELECT role, content, timestamp, pinned 
             FROM conversations 
-            WHERE timestamp > datetime('now', '-7 days')
-            ORDER BY timestamp ASC
-        """)
-        
-        for row in cursor.fetchall():
-            session_id, role, content, timestamp = row
-            if session_id not in self.conversation_cache:
-                self.conversation_cache[session_id] = []
-            
+            WHERE session_id = ? AND (pinned OR id IN (
+                SELECT id FROM conversations 
+                WHERE session_id = ? AND timestamp > datetime('now', ?)
+                ORDER BY timestamp DESC, id DESC
+                LIMIT ?
+            ))
+            ORDER BY timestamp, id
+        """, (session_id, session_id, max_age, self.config.chat_memory_limit))
+        
+        # Another task may have loaded it while we waited
+        if session_id not in self.conversation_cache:
             # Store with timestamp for internal use, but don't include in API calls
-            self.conversation_cache[session_id].append({
-                "role": role,
-                "content": content,
-                "timestamp": timestamp
-            })
+            self.conversation_cache[session_id] = [
+                {"role": role, "content": content, "timestamp": timestamp,
+                 **({"pinned": True} if pinned else {})}
+                for role, content, timestamp, pinned in rows
+            ]
+            self._resize(session_id)
+        else:
+            self.conversation_cache.move_to_end(session_id)
+        return self.conversation_cache[session_id]
+    
+    def _resize(self, session_id: str):
+        """Re-measure a session after it changed, evicting others over the byte budget"""
+        self.session_bytes[session_id] = sum(
+            _message_bytes(msg) for msg in self.conversation_cache[session_id]
+        )
         
-        conn.close()
+        # The session just used is last and always stays, as do sessions with
+        # rows not yet flushed, which a reload wouldn't find
+        total = sum(self.session_bytes.values())
+        for candidate in list(self.conversation_cache):
+            if total <= self.config.session_cache_bytes:
+                break
+            if candidate == session_id or self._unflushed.get(candidate):
+                continue
+            del self.conversation_cache[candidate]
+            total -= self.session_bytes.pop(candidate, 0)
+            self.logger.debug(f"Evicted session {candidate} from the history cache")
     
-    async def add_to_conversation(self, session_id: str, user_message: str, assistant_response: str):
-        """Add conversation to memory"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    async def add_to_conversation(self, session_id: str, user_message: str, assistant_response: str,
+                                  usage: Optional[Dict[str, int]] = None, costs: tuple = (0.0, 0.0),
+                                  pinned: bool = False):
+        """Add conversation to memory.
         
-        # Add user message
-        cursor.execute("""
-            INSERT INTO conversations (session_id, role, content) 
-            VALUES (?, ?, ?)
-        """, (session_id, "user", user_message))
+        The turn is cached at once and written to the database behind the
+        request, batched with other sessions' turns (see flush). A pinned
+        user message stays in the history past chat_memory_limit.
         
-        # Add assistant response
-        cursor.execute("""
-            INSERT INTO conversations (session_id, role, content) 
-            VALUES (?, ?, ?)
-        """, (session_id, "assistant", assistant_response))
+        Input tokens (including prompt cache reads/writes) and input cost are
+        recorded on the user row, output tokens and cost on the assistant row.
+        """
+        usage = usage or {}
+        input_tokens = (
+            usage.get("input_tokens", 0)
+            + usage.get("cache_creation_input_tokens", 0)
+            + usage.get("cache_read_input_tokens", 0)
+        )
+        output_tokens = usage.get("output_tokens", 0)
+        input_cost, output_cost = costs
         
-        conn.commit()
-        conn.close()
+        history = await self._session(session_id)
         
-        # Update cache
-        if session_id not in self.conversation_cache:
-            self.conversation_cache[session_id] = []
+        # Same format as CURRENT_TIMESTAMP, so queued rows sort with the rest
+        timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        history.extend([
+            {"role": "user", "content": user_message, "timestamp": timestamp,
+             **({"pinned": True} if pinned else {})},
+            {"role": "assistant", "content": assistant_response, "timestamp": timestamp}
+        ])
+        
+        # Limit cache size, as loading does: the newest messages plus pinned ones
+        excess = len(history) - self.config.chat_memory_limit
+        if excess > 0:
+            history[:] = [msg for index, msg in enumerate(history) if index >= excess or msg.get("pinned")]
         
-        self.conversation_cache[session_id].extend([
-            {"role": "user", "content": user_message, "timestamp": datetime.now().isoformat()},
-            {"role": "assistant", "content": assistant_response, "timestamp": datetime.now().isoformat()}
+        self._pending.extend([
+            (session_id, "user", user_message, input_tokens, input_cost, timestamp, int(pinned)),
+            (session_id, "assistant", assistant_response, output_tokens, output_cost, timestamp, 0)
         ])
+        self._unflushed[session_id] = self._unflushed.get(session_id, 0) + 2
+        self._resize(session_id)
+        
+        if self.config.memory_flush_interval <= 0:
+            await self.flush()
+        else:
+            self._schedule_flush()
+    
+    def _schedule_flush(self):
+        """Make sure a flusher is running on this loop, and hurry it if enough rows are waiting"""
+        loop = asyncio.get_running_loop()
+        if self._flusher is None or self._flusher.done() or self._flusher.get_loop() is not loop:
+            self._flush_due = asyncio.Event()
+            self._flusher = loop.create_task(self._flush_loop())
+        if len(self._pending) >= self.config.memory_flush_rows:
+            self._flush_due.set()
+    
+    async def _flush_loop(self):
+        """Flush queued rows every memory_flush_interval seconds until none are left"""
+        try:
+            while self._pending:
+                try:
+                    await asyncio.wait_for(self._flush_due.wait(), self.config.memory_flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._flush_due.clear()
+                try:
+                    await self.flush()
+                except Exception as e:
+                    # Rows stay queued for the next attempt
+                    self.logger.error(f"Error flushing conversation memory: {e}")
+        except asyncio.CancelledError:
+            # The loop is shutting down; write what's left before it goes
+            await self.flush()
+            raise
+    
+    async def flush(self):
+        """Write all queued conversation rows in one transaction"""
+        if not self._pending:
+            return
+        
+        rows, self._pending = self._pending, []
+        inserted = False
+        try:
+            async with self.db.transaction() as conn:
+                await conn.executemany("""
+                    INSERT INTO conversations (session_id, role, content, tokens, cost, timestamp, pinned) 
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, rows)
+                inserted = True
+        except asyncio.CancelledError:
+            # Once the rows are in, the shielded COMMIT completes anyway;
+            # queueing them again would insert them twice
+            if inserted:
+                self._mark_flushed(rows)
+            else:
+                self._pending[:0] = rows
+            raise
+        except BaseException:
+            self._pending[:0] = rows
+            raise
         
-        # Limit cache size
-        if len(self.conversation_cache[session_id]) > self.config.chat_memory_limit:
-            self.conversation_cache[session_id] = self.conversation_cache[session_id][-self.config.chat_memory_limit:]
+        self._mark_flushed(rows)
+    
+    def _mark_flushed(self, rows: List[tuple]):
+        """Let sessions whose rows are all written be evicted again"""
+        for row in rows:
+            remaining = self._unflushed.get(row[0], 0) - 1
+            if remaining > 0:
+                self._unflushed[row[0]] = remaining
+            else:
+                self._unflushed.pop(row[0], None)
+        self.logger.debug(f"Flushed {len(rows)} conversation rows")
     
     async def get_conversation_history(self, session_id: str) -> List[Dict]:
         """Get conversation history for session - API compatible format"""
-        if session_id not in self.conversation_cache:
-            return []
+        history = await self._session(session_id)
         
         # Return only role and content for API compatibility
         api_messages = []
-        for msg in self.conversation_cache[session_id]:
-            api_messages.append({
+        for msg in history:
+            api_message = {
                 "role": msg["role"],
                 "content": msg["content"]
-            })
+            }
+            if msg.get("pinned"):
+                api_message["pinned"] = True
+            api_messages.append(api_message)
         
         return api_messages
     
-    async def save_artifact(self, name: str, content: str, category: str = "general"):
-        """Save artifact with metadata"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    @asynccontextmanager
+    async def turn(self):
+        """Scope a chat turn: if it's cancelled or abandoned, artifact writes it made are undone"""
+        journal = []
+        token = _turn_journal.set(journal)
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            await asyncio.shield(self._rollback_artifacts(journal))
+            raise
+        finally:
+            try:
+                _turn_journal.reset(token)
+            except ValueError:
+                # Generator closed from another context
+                pass
+    
+    async def _rollback_artifacts(self, journal: list):
+        """Restore artifacts to their state before the journaled writes"""
+        if not journal:
+            return
+        
+        async with self.db.transaction() as conn:
+            for name, previous in reversed(journal):
+                if previous is None:
+                    await conn.execute("DELETE FROM artifacts WHERE name = ?", (name,))
+                else:
+                    await conn.execute(UPSERT_ARTIFACT, (
+                        name, previous["content"], previous["category"], previous["updated_at"]
+                    ))
         
-        cursor.execute("""
-            INSERT OR REPLACE INTO artifacts (name, content, category, updated_at) 
-            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
-        """, (name, content, category))
+        for name, previous in reversed(journal):
+            if previous is None:
+                self.artifact_cache.pop(name, None)
+            else:
+                self.artifact_cache[name] = previous
+        self.logger.info(f"Rolled back {len(journal)} artifact writes from a cancelled turn")
+    
+    async def save_artifact(self, name: str, content: str, category: str = "general", cache: bool = True):
+        """Save artifact with metadata; cache=False keeps large ones out of memory"""
+        journal = _turn_journal.get()
+        if journal is not None:
+            journal.append((name, await self.get_artifact(name)))
         
-        conn.commit()
-        conn.close()
+        await self.db.execute(UPSERT_ARTIFACT, (
+            name, content, category, datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+        ))
         
         # Update cache
-        self.artifact_cache[name] = {
-            "content": content,
-            "category": category,
-            "updated_at": datetime.now().isoformat()
-        }
+        if cache:
+            self.artifact_cache[name] = {
+                "content": content,
+                "category": category,
+                "updated_at": datetime.now().isoformat()
+            }
+        else:
+            self.artifact_cache.pop(name, None)
     
     async def get_artifact(self, name: str) -> Optional[Dict]:
         """Get artifact by name"""
         if name in self.artifact_cache:
             return self.artifact_cache[name]
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
+        row = await self.db.fetchone("""
             SELECT content, category, updated_at 
             FROM artifacts 
             WHERE name = ?
         """, (name,))
         
-        row = cursor.fetchone()
-        conn.close()
-        
         if row:
             return {
                 "content": row[0],
@@ -173,6 +325,115 @@ class MemoryManager:
             }
         return None
     
+    async def read_artifact_range(self, name: str, offset: int, length: int) -> Optional[tuple]:
+        """(slice of an artifact's content, its total length), without loading all of it"""
+        row = await self.db.fetchone(
+            "SELECT substr(content, ?, ?), length(content) FROM artifacts WHERE name = ?",
+            (offset + 1, length, name)
+        )
+        return tuple(row) if row else None
+    
+    async def save_attachment(self, path: str, content: str) -> str:
+        """Store an attached file's content once; returns its content hash"""
+        digest = content_hash(content)
+        await self.db.execute("""
+            INSERT OR IGNORE INTO attachments (hash, path, content, size)
+            VALUES (?, ?, ?, ?)
+        """, (digest, path, content, len(content)))
+        return digest
+    
+    async def get_attachments(self, hashes: List[str]) -> Dict[str, str]:
+        """Content of stored attachments by hash; unknown hashes are left out"""
+        hashes = list(dict.fromkeys(hashes))
+        if not hashes:
+            return {}
+        
+        rows = await self.db.fetchall(
+            f"SELECT hash, content FROM attachments WHERE hash IN ({','.join('?' * len(hashes))})",
+            hashes
+        )
+        return dict(rows)
+    
+    async def search(self, query: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Full-text search over conversations and artifacts, best matches first.
+        
+        Words in query must all match (stemmed, case-insensitive); end a
+        word with * to match it as a prefix. Each result has a snippet with
+        the matches in **bold** and a score, higher being better.
+        """
+        match = fts_query(query)
+        if not match or limit < 1:
+            return []
+        
+        # Queued turns should be findable too
+        await self.flush()
+        
+        # Rank and snippet in the FTS table alone, then look up the few winners
+        conversations = await self.db.fetchall("""
+            SELECT c.session_id, c.role, c.timestamp, hits.snippet, hits.rank
+            FROM (
+                SELECT rowid, snippet(conversations_fts, 0, '**', '**', '…', ?) AS snippet, rank
+                FROM conversations_fts WHERE conversations_fts MATCH ?
+                ORDER BY rank LIMIT ?
+            ) AS hits
+            JOIN conversations c ON c.id = hits.rowid
+            ORDER BY hits.rank
+        """, (SNIPPET_TOKENS, match, limit))
+        artifacts = await self.db.fetchall("""
+            SELECT a.name, a.category, a.updated_at, hits.snippet, hits.rank
+            FROM (
+                SELECT rowid, snippet(artifacts_fts, -1, '**', '**', '…', ?) AS snippet, rank
+                FROM artifacts_fts WHERE artifacts_fts MATCH ?
+                ORDER BY rank LIMIT ?
+            ) AS hits
+            JOIN artifacts a ON a.id = hits.rowid
+            ORDER BY hits.rank
+        """, (SNIPPET_TOKENS, match, limit))
+        
+        # bm25 ranks are negative, better matches more so
+        results = [
+            {"type": "conversation", "session_id": session_id, "role": role, "timestamp": timestamp,
+             "snippet": snippet, "score": round(-rank, 4)}
+            for session_id, role, timestamp, snippet, rank in conversations
+        ] + [
+            {"type": "artifact", "name": name, "category": category, "timestamp": updated_at,
+             "snippet": snippet, "score": round(-rank, 4)}
+            for name, category, updated_at, snippet, rank in artifacts
+        ]
+        results.sort(key=lambda result: result["score"], reverse=True)
+        return results[:limit]
+    
     async def save_all(self):
         """Save all cached data"""
-        self.logger.info("Memory saved successfully")
\ No newline at end of file
+        await self.flush()
+        self.logger.info("Memory saved successfully")
+
+
+def _message_bytes(msg: Dict) -> int:
+    """Approximate memory held by a cached message"""
+    content = msg["content"]
+    if isinstance(content, str):
+        return sys.getsizeof(content)
+    return len(json.dumps(content))
+
+
+def fts_query(text: str) -> str:
+    """FTS5 MATCH expression for free text: every word quoted, so punctuation can't break the syntax"""
+    terms = re.findall(r"\w+\*?", text)
+    return " ".join(f'"{term[:-1]}"*' if term.endswith("*") else f'"{term}"' for term in terms)
+
+
+def format_search_results(query: str, results: List[Dict[str, Any]]) -> str:
+    """Search results as numbered lines, for the tool and the CLI"""
+    if not results:
+        return f"No matches for '{query}'"
+    
+    lines = []
+    for number, result in enumerate(results, 1):
+        if result["type"] == "conversation":
+            source = f"{result['session_id']} · {result['role']}"
+        else:
+            source = f"artifact '{result['name']}' ({result['category']})"
+        snippet = " ".join(result["snippet"].split())
+        lines.append(f"{number}. [{source} · {result['timestamp']}] {snippet}")
+    return "\n".join(lines)
@@ -0,0 +1,112 @@
+# src/core/memory_schema.py
+"""Schema of thor_memory.db as an ordered list of migrations.
+
+Migration N (counting from 1) takes the database from schema version
+N - 1 to N; the version is kept in PRAGMA user_version. Only ever
+append: released migrations have already run on users' databases.
+"""
+
+MIGRATIONS = [
+    # 1: conversations and artifacts. IF NOT EXISTS because databases from
+    # before versioning already have them, at version 0.
+    (
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            tokens INTEGER DEFAULT 0,
+            cost REAL DEFAULT 0.0
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE,
+            content TEXT NOT NULL,
+            category TEXT DEFAULT 'general',
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            access_count INTEGER DEFAULT 0
+        )
+        """,
+    ),
+    # 2: attachments, stored once by content hash and referenced from messages
+    (
+        """
+        CREATE TABLE IF NOT EXISTS attachments (
+            hash TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            content TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ),
+    # 3: indexes for per-session history, recent-history scans and artifact listings
+    (
+        "CREATE INDEX IF NOT EXISTS idx_conversations_session_time ON conversations (session_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_time ON conversations (timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_artifacts_category_updated ON artifacts (category, updated_at)",
+        "ANALYZE",
+    ),
+    # 4: full-text search. External-content FTS5 tables index the text in
+    # place and triggers keep them in step with every write.
+    (
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS conversations_fts USING fts5(
+            content, content='conversations', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_insert AFTER INSERT ON conversations BEGIN
+            INSERT INTO conversations_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_delete AFTER DELETE ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS conversations_fts_update AFTER UPDATE OF content ON conversations BEGIN
+            INSERT INTO conversations_fts (conversations_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            INSERT INTO conversations_fts (rowid, content) VALUES (new.id, new.content);
+        END
+        """,
+        "INSERT INTO conversations_fts (conversations_fts) VALUES ('rebuild')",
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS artifacts_fts USING fts5(
+            name, content, content='artifacts', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS artifacts_fts_insert AFTER INSERT ON artifacts BEGIN
+            INSERT INTO artifacts_fts (rowid, name, content) VALUES (new.id, new.name, new.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS artifacts_fts_delete AFTER DELETE ON artifacts BEGIN
+            INSERT INTO artifacts_fts (artifacts_fts, rowid, name, content)
+            VALUES ('delete', old.id, old.name, old.content);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS artifacts_fts_update AFTER UPDATE OF name, content ON artifacts BEGIN
+            INSERT INTO artifacts_fts (artifacts_fts, rowid, name, content)
+            VALUES ('delete', old.id, old.name, old.content);
+            INSERT INTO artifacts_fts (rowid, name, content) VALUES (new.id, new.name, new.content);
+        END
+        """,
+        "INSERT INTO artifacts_fts (artifacts_fts) VALUES ('rebuild')",
+        # Matches in an artifact's name count for more than in its content
+        "INSERT INTO artifacts_fts (artifacts_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    ),
+    # 5: pinned messages, kept in context however old they get
+    (
+        "ALTER TABLE conversations ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_conversations_pinned ON conversations (session_id) WHERE pinned",
+    ),
+]
@@ -0,0 +1,172 @@
+# src/core/metrics.py
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, math.inf)
+
+METRIC_NAME = "thor_span_seconds"
+
+LabelSet = Tuple[Tuple[str, str], ...]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {_format_bound(bound): count for bound, count in zip(self.buckets, self.counts)}
+        }
+
+
+class Span:
+    """Times a block and records it; seconds is set on exit"""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: Dict[str, str]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self.started = 0.0
+        self.seconds = 0.0
+
+    def __enter__(self) -> "Span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.seconds = time.perf_counter() - self.started
+        self.registry.observe(self.name, self.seconds, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """Span timings aggregated into histograms, keyed by span name and labels"""
+
+    def __init__(self):
+        self.histograms: Dict[LabelSet, Histogram] = {}
+        self.dump_path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    def span(self, name: str, **labels: str) -> Span:
+        """with metrics.span("history_fetch"): ..."""
+        return Span(self, name, labels)
+
+    def observe(self, name: str, seconds: float, **labels: str):
+        """Record a span duration"""
+        key = (("span", name),) + tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+        if self.dump_path:
+            self._dump({"at": time.time(), "span": name, "seconds": round(seconds, 6), **labels})
+
+    def dump_to(self, path: Optional[str]):
+        """Also append every span to path as JSON lines (None stops dumping)"""
+        self.dump_path = path
+
+    def _dump(self, record: Dict[str, Any]):
+        try:
+            with open(self.dump_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            logger.error(f"Error writing metrics dump: {e}")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Every histogram as plain data, for the WebSocket metrics message"""
+        with self._lock:
+            return [
+                {"labels": dict(key), **histogram.snapshot()}
+                for key, histogram in sorted(self.histograms.items())
+            ]
+
+    def render_prometheus(self) -> str:
+        """Prometheus text exposition format"""
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each phase of a chat turn",
+            f"# TYPE {METRIC_NAME} histogram"
+        ]
+        with self._lock:
+            for key, histogram in sorted(self.histograms.items()):
+                labels = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{_format_bound(bound)}"}} {count}')
+                lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.sum}")
+                lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    async def start_server(self, host: str = "localhost", port: int = 9464) -> asyncio.AbstractServer:
+        """Serve GET /metrics over plain HTTP; one server per process"""
+        if self._server is None:
+            self._server = await asyncio.start_server(self._handle_http, host, port)
+            logger.info(f"Metrics endpoint on http://{host}:{port}/metrics")
+        return self._server
+
+    async def stop_server(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await reader.readline()
+            # Drain headers; the request body (if any) is ignored
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+
+            parts = request_line.decode("latin-1").split()
+            if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+                status, body = "200 OK", self.render_prometheus()
+            else:
+                status, body = "404 Not Found", "Not found\n"
+
+            payload = body.encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + payload
+            )
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+def _format_bound(bound: float) -> str:
+    return "+Inf" if bound == math.inf else repr(bound)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+# Process-wide registry shared by every ThorClient
+metrics = MetricsRegistry()
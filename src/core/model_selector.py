@@ -1,10 +1,27 @@
 # src/core/model_selector.py
 import time
 import json
-from typing import Dict, Tuple, Optional
+import re
+from typing import Dict, List, Tuple, Optional
 from datetime import datetime, timedelta
 import logging
 from .config import ModelConfig
+from .model_telemetry import get_telemetry
+
+# Prompt cache pricing relative to the base input price
+CACHE_WRITE_MULTIPLIER = 1.25
+CACHE_READ_MULTIPLIER = 0.1
+
+# Message Batches API requests are billed at half price
+BATCH_DISCOUNT = 0.5
+
+# Asked of the fast model in cascade mode so its answer can be judged
+CONFIDENCE_INSTRUCTION = (
+    "End your reply with <confidence>X</confidence>, where X is a number from 0 to 1 "
+    "for how sure you are that the reply is complete and correct without help from a "
+    "more capable model."
+)
+CONFIDENCE_PATTERN = re.compile(r"\s*<confidence>\s*([0-9.]+)\s*</confidence>\s*$")
 
 class ModelSelector:
     """Intelligent model selection with cost optimization"""
@@ -12,6 +29,7 @@ class ModelSelector:
     def __init__(self, config_manager):
         self.config = config_manager.config
         self.daily_usage = self.load_daily_usage()
+        self.telemetry = get_telemetry()
         self.logger = logging.getLogger(__name__)
         
     def load_daily_usage(self) -> Dict:
@@ -32,35 +50,160 @@ class ModelSelector:
             json.dump(self.daily_usage, f)
     
     def choose_model(self, task: str, complexity: str = "medium") -> Tuple[str, ModelConfig]:
-        """Choose optimal model based on task and budget"""
+        """Choose optimal model based on task, budget and observed performance.
+        
+        With a latency SLO for the task type, the cheapest model whose p95
+        meets it wins; a model with a spike of recent errors is failed over.
+        """
         
         # Check daily budget
         if self.daily_usage['cost'] >= self.config.max_daily_spend:
             self.logger.warning("Daily budget exceeded, using most economical model")
             return "haiku-4", self.config.model_configs["haiku-4"]
         
-        # Task-based selection
+        model_name = self._preferred_model(task, complexity)
+        
+        slo = self.config.latency_slos.get(task)
+        if slo:
+            model_name = self._cheapest_within_slo(task, slo) or model_name
+        
+        if not self._healthy(model_name):
+            model_name = self._failover(model_name)
+        
+        return model_name, self.config.model_configs[model_name]
+    
+    def _preferred_model(self, task: str, complexity: str) -> str:
+        """Task-based selection"""
         if task in ['coding', 'debugging', 'implementation', 'quick_fix']:
             if complexity == "high" and self.daily_usage['cost'] < self.config.max_daily_spend * 0.8:
-                return 'opus-4', self.config.model_configs['opus-4']
-            return 'sonnet-4', self.config.model_configs['sonnet-4']
+                return 'opus-4'
+            return 'sonnet-4'
         
         elif task in ['architecture', 'security_audit', 'complex_analysis']:
-            return 'opus-4', self.config.model_configs['opus-4']
+            return 'opus-4'
         
         elif task in ['simple_query', 'quick_response']:
-            return 'haiku-4', self.config.model_configs['haiku-4']
+            return 'haiku-4'
         
         else:
-            return 'sonnet-4', self.config.model_configs['sonnet-4']
+            return 'sonnet-4'
+    
+    def _by_price(self) -> List[str]:
+        """Model names from cheapest to most expensive"""
+        return sorted(
+            self.config.model_configs,
+            key=lambda name: (self.config.model_configs[name].input_cost_per_1k
+                              or self.config.model_configs[name].cost_per_1k_tokens)
+        )
+    
+    def _healthy(self, model_name: str) -> bool:
+        error_rate = self.telemetry.recent_error_rate(model_name)
+        return error_rate is None or error_rate < self.config.failover_error_rate
+    
+    def _cheapest_within_slo(self, task: str, p95_seconds: float) -> Optional[str]:
+        for model_name in self._by_price():
+            if self._healthy(model_name) and self.telemetry.meets_slo(model_name, task, p95_seconds):
+                return model_name
+        return None
+    
+    def _failover(self, model_name: str) -> str:
+        """Nearest healthy model, trying more capable ones before cheaper ones"""
+        models = self._by_price()
+        position = models.index(model_name)
+        for candidate in models[position + 1:] + models[:position][::-1]:
+            if self._healthy(candidate):
+                self.logger.warning(f"Failing over from {model_name} to {candidate} after recent errors")
+                return candidate
+        return model_name
+    
+    def cascade_plan(self, task: str, complexity: str = "medium") -> Optional[Tuple[str, str]]:
+        """(fast model, escalation model) when a turn should cascade, else None"""
+        if not self.config.cascade_enabled:
+            return None
+        
+        model_name, _ = self.choose_model(task, complexity)
+        fast_model = self.config.cascade_model
+        if fast_model == model_name or fast_model not in self.config.model_configs:
+            return None
+        return fast_model, model_name
+    
+    def parse_confidence(self, text: str) -> Tuple[str, Optional[float]]:
+        """Split a trailing confidence marker off text: (text, confidence or None)"""
+        match = CONFIDENCE_PATTERN.search(text)
+        if not match:
+            return text, None
+        try:
+            confidence = float(match.group(1))
+        except ValueError:
+            return text[:match.start()], None
+        return text[:match.start()], min(max(confidence, 0.0), 1.0)
+    
+    def should_escalate(self, confidence: Optional[float], tool_calls: int) -> bool:
+        """Whether the fast model's answer should be redone by the larger model"""
+        if tool_calls > self.config.cascade_max_tool_calls:
+            return True
+        if tool_calls:
+            # A short tool plan is fine; confidence is judged on the final answer
+            return False
+        return confidence is None or confidence < self.config.cascade_confidence_threshold
+    
+    def record_cascade(self, task: str, escalated: bool, latency: float):
+        """Record one cascaded turn's outcome and API latency for its task type"""
+        stats = self.daily_usage.setdefault('cascade', {}).setdefault(
+            task, {'requests': 0, 'escalations': 0, 'latency': 0.0, 'escalated_latency': 0.0}
+        )
+        stats['requests'] += 1
+        stats['latency'] += latency
+        if escalated:
+            stats['escalations'] += 1
+            stats['escalated_latency'] += latency
+        self.save_daily_usage()
+    
+    def cascade_stats(self) -> Dict[str, Dict[str, float]]:
+        """Escalation rate and mean latency per task type for today"""
+        report = {}
+        for task, stats in self.daily_usage.get('cascade', {}).items():
+            accepted = stats['requests'] - stats['escalations']
+            report[task] = {
+                'requests': stats['requests'],
+                'escalation_rate': stats['escalations'] / stats['requests'] if stats['requests'] else 0.0,
+                'accepted_latency': (stats['latency'] - stats['escalated_latency']) / accepted if accepted else 0.0,
+                'escalated_latency': stats['escalated_latency'] / stats['escalations'] if stats['escalations'] else 0.0
+            }
+        return report
     
     def estimate_cost(self, input_tokens: int, output_tokens: int, model_name: str) -> float:
-        """Estimate cost for request"""
+        """Estimate cost for request from token counts"""
+        input_cost, output_cost = self.cost_breakdown(
+            model_name, {"input_tokens": input_tokens, "output_tokens": output_tokens}
+        )
+        return input_cost + output_cost
+    
+    def cost_breakdown(self, model_name: str, usage: Dict[str, int], batch: bool = False) -> Tuple[float, float]:
+        """Price API usage as (input cost, output cost) with per-direction rates"""
         model_config = self.config.model_configs[model_name]
-        return (input_tokens + output_tokens) * model_config.cost_per_1k_tokens / 1000
+        input_rate = model_config.input_cost_per_1k or model_config.cost_per_1k_tokens
+        output_rate = model_config.output_cost_per_1k or model_config.cost_per_1k_tokens
+        
+        input_cost = (
+            usage.get('input_tokens', 0)
+            + usage.get('cache_creation_input_tokens', 0) * CACHE_WRITE_MULTIPLIER
+            + usage.get('cache_read_input_tokens', 0) * CACHE_READ_MULTIPLIER
+        ) * input_rate / 1000
+        output_cost = usage.get('output_tokens', 0) * output_rate / 1000
+        if batch:
+            return input_cost * BATCH_DISCOUNT, output_cost * BATCH_DISCOUNT
+        return input_cost, output_cost
     
-    def update_usage(self, cost: float):
-        """Update daily usage tracking"""
+    def update_usage(self, cost: float, usage: Optional[Dict[str, int]] = None, count_request: bool = True):
+        """Update daily usage tracking; count_request=False adds cost and tokens only"""
         self.daily_usage['cost'] += cost
-        self.daily_usage['requests'] += 1
+        if count_request:
+            self.daily_usage['requests'] += 1
+        if usage:
+            for key, usage_key in (('input_tokens', 'input_tokens'),
+                                   ('output_tokens', 'output_tokens'),
+                                   ('cache_read_tokens', 'cache_read_input_tokens'),
+                                   ('cache_write_tokens', 'cache_creation_input_tokens')):
+                self.daily_usage[key] = self.daily_usage.get(key, 0) + usage.get(usage_key, 0)
         self.save_daily_usage()
\ No newline at end of file
@@ -0,0 +1,170 @@
+# src/core/model_telemetry.py
+import atexit
+import json
+import logging
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional
+
+# Calls kept per (model, task type)
+WINDOW_SIZE = 200
+
+# Fewer samples than this and a model's numbers aren't trusted yet
+MIN_SAMPLES = 5
+
+# Only errors this recent count towards a model's health
+ERROR_WINDOW_SECONDS = 300
+
+# Unsaved samples are written after this many records or this many seconds,
+# whichever comes first, and at exit
+SAVE_EVERY_RECORDS = 20
+SAVE_INTERVAL_SECONDS = 30.0
+
+_instances: "weakref.WeakSet[ModelTelemetry]" = weakref.WeakSet()
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of values (0 for an empty list)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class ModelTelemetry:
+    """Rolling per-model, per-task-type call statistics persisted to JSON"""
+
+    def __init__(self, path: str = "model_telemetry.json", window: int = WINDOW_SIZE):
+        # Absolute, since a deferred save may run after the working directory changed
+        self.path = Path(path).resolve()
+        self.window = window
+        self.logger = logging.getLogger(__name__)
+        self.samples: Dict[str, Deque[Dict[str, Any]]] = {}
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+        self.load()
+        _instances.add(self)
+
+    @staticmethod
+    def _key(model: str, task: str) -> str:
+        return f"{model}|{task}"
+
+    def load(self):
+        """Load samples saved by a previous run"""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (json.JSONDecodeError, OSError) as e:
+            self.logger.warning(f"Ignoring unreadable telemetry file {self.path}: {e}")
+            return
+
+        for key, samples in data.get("samples", {}).items():
+            self.samples[key] = deque(samples, maxlen=self.window)
+
+    def save(self):
+        """Persist samples"""
+        self.unsaved = 0
+        self.last_save = time.monotonic()
+        tmp_path = self.path.with_suffix(self.path.suffix + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({"samples": {key: list(samples) for key, samples in self.samples.items()}}, f)
+        tmp_path.replace(self.path)
+
+    def record(self, model: str, task: str, latency: float, output_tokens: int = 0,
+               error: bool = False, first_token: Optional[float] = None):
+        """Record one upstream call"""
+        sample = {
+            "at": time.time(),
+            "latency": round(latency, 4),
+            "output_tokens": output_tokens,
+            "error": error
+        }
+        if first_token is not None:
+            sample["first_token"] = round(first_token, 4)
+        self.samples.setdefault(self._key(model, task), deque(maxlen=self.window)).append(sample)
+
+        # Rewriting the whole file on every call would block the event loop
+        self.unsaved += 1
+        if (self.unsaved >= SAVE_EVERY_RECORDS
+                or time.monotonic() - self.last_save >= SAVE_INTERVAL_SECONDS):
+            self.save()
+
+    def flush(self):
+        """Save if any samples haven't been yet"""
+        if self.unsaved:
+            self.save()
+
+    def stats(self, model: str, task: str) -> Dict[str, float]:
+        """Sample count, latency p50/p95, mean output tokens and error rate"""
+        samples = list(self.samples.get(self._key(model, task), ()))
+        succeeded = [s for s in samples if not s["error"]]
+        latencies = [s["latency"] for s in succeeded]
+        return {
+            "samples": len(samples),
+            "p50": percentile(latencies, 50),
+            "p95": percentile(latencies, 95),
+            "output_tokens": sum(s["output_tokens"] for s in succeeded) / len(succeeded) if succeeded else 0.0,
+            "error_rate": (len(samples) - len(succeeded)) / len(samples) if samples else 0.0
+        }
+
+    def first_token_latencies(self, model: str) -> List[float]:
+        """Time-to-first-token of a model's successful calls, across task types"""
+        return [
+            s["first_token"]
+            for key, samples in self.samples.items() if key.startswith(f"{model}|")
+            for s in samples if "first_token" in s and not s["error"]
+        ]
+
+    def recent_error_rate(self, model: str) -> Optional[float]:
+        """Error rate across task types over the last few minutes, None if too few calls"""
+        cutoff = time.time() - ERROR_WINDOW_SECONDS
+        recent = [
+            s for key, samples in self.samples.items() if key.startswith(f"{model}|")
+            for s in samples if s["at"] >= cutoff
+        ]
+        if len(recent) < MIN_SAMPLES:
+            return None
+        return sum(1 for s in recent if s["error"]) / len(recent)
+
+    def meets_slo(self, model: str, task: str, p95_seconds: float) -> bool:
+        """Whether a model's p95 latency for task is within the SLO.
+
+        Models without enough samples are given the benefit of the doubt
+        so they get tried and measured.
+        """
+        stats = self.stats(model, task)
+        if stats["samples"] < MIN_SAMPLES:
+            return True
+        return stats["p95"] <= p95_seconds
+
+
+# One telemetry object per file for the whole process. Every ModelSelector
+# (CLI, WebSocket bridge, swarm sessions) records into and routes on the same
+# rolling windows, and their debounced saves can't overwrite each other.
+_telemetries: Dict[Path, ModelTelemetry] = {}
+_telemetries_lock = threading.Lock()
+
+
+def get_telemetry(path: str = "model_telemetry.json") -> ModelTelemetry:
+    """Get the shared telemetry for a file"""
+    key = Path(path).resolve()
+    with _telemetries_lock:
+        if key not in _telemetries:
+            _telemetries[key] = ModelTelemetry(str(key))
+        return _telemetries[key]
+
+
+@atexit.register
+def _flush_all():
+    for telemetry in list(_instances):
+        try:
+            telemetry.flush()
+        except OSError as e:
+            telemetry.logger.error(f"Error saving telemetry to {telemetry.path}: {e}")
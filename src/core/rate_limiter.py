@@ -0,0 +1,152 @@
+# src/core/rate_limiter.py
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at a per-minute rate"""
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount: float = 1):
+        """Wait until amount tokens are available, then take them"""
+        amount = min(amount, self.capacity)
+        while True:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return
+            await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def consume(self, amount: float):
+        """Take tokens without waiting; the balance may go negative"""
+        self._refill()
+        self.tokens -= amount
+
+
+class AdaptiveConcurrency:
+    """AIMD concurrency window: +1 per window of successes, halved on overload"""
+
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = float(maximum)
+        self.in_flight = 0
+        self._waiters = []
+
+    async def acquire(self):
+        while self.in_flight >= int(self.limit):
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            finally:
+                self._waiters.remove(waiter)
+        self.in_flight += 1
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_overload(self):
+        self.limit = max(self.minimum, self.limit / 2)
+
+    def _wake(self):
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+
+class RateLimiter:
+    """Client-side pacing per model: request and token buckets plus an AIMD window"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, max_concurrency: int,
+                 backoff_base: float = 1.0, backoff_cap: float = 60.0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self._models: Dict[str, Tuple[TokenBucket, TokenBucket, AdaptiveConcurrency]] = {}
+        self._blocked_until: Dict[str, float] = {}
+
+    def _for_model(self, model: str) -> Tuple[TokenBucket, TokenBucket, AdaptiveConcurrency]:
+        if model not in self._models:
+            self._models[model] = (
+                TokenBucket(self.requests_per_minute),
+                TokenBucket(self.tokens_per_minute),
+                AdaptiveConcurrency(self.max_concurrency)
+            )
+        return self._models[model]
+
+    @asynccontextmanager
+    async def slot(self, model: str, estimated_tokens: int = 0) -> AsyncIterator[None]:
+        """Hold a paced request slot for model"""
+        requests, tokens, window = self._for_model(model)
+
+        delay = self._blocked_until.get(model, 0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        await requests.acquire()
+        await tokens.acquire(estimated_tokens)
+        await window.acquire()
+        try:
+            yield
+        finally:
+            window.release()
+
+    def record_tokens(self, model: str, extra_tokens: int):
+        """Correct the token bucket once actual usage is known"""
+        self._for_model(model)[1].consume(extra_tokens)
+
+    def on_success(self, model: str):
+        self._for_model(model)[2].on_success()
+
+    def on_overload(self, model: str, retry_after: Optional[float] = None):
+        """Shrink the window and pause the model after a 429/529"""
+        window = self._for_model(model)[2]
+        window.on_overload()
+        if retry_after:
+            self._blocked_until[model] = max(
+                self._blocked_until.get(model, 0), time.monotonic() + retry_after
+            )
+        logger.warning(f"Rate limited on {model}; concurrency window now {int(window.limit)}")
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """Full-jitter exponential backoff, never shorter than Retry-After"""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+        return max(delay, retry_after or 0)
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(key: str, requests_per_minute: int, tokens_per_minute: int,
+                     max_concurrency: int) -> RateLimiter:
+    """Get the process-wide limiter for an API key; limits apply per key, not per client"""
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(requests_per_minute, tokens_per_minute, max_concurrency)
+        return _limiters[key]
@@ -0,0 +1,146 @@
+# src/core/response_cache.py
+import hashlib
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from .storage import Database, open_database
+
+
+def request_fingerprint(**params: Any) -> str:
+    """Content hash of a request's parameters"""
+    canonical = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# Schema of thor_cache.db; see core.memory_schema for how migrations work
+CACHE_MIGRATIONS = [
+    (
+        """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses (last_access)",
+    ),
+    # Expiry sweeps on every put are range scans rather than full scans
+    (
+        "CREATE INDEX IF NOT EXISTS idx_responses_created_at ON responses (created_at)",
+    ),
+]
+
+
+class ResponseCache:
+    """Content-addressed SQLite cache of model responses with TTL and LRU eviction.
+
+    Runs on the shared storage.Database for its file, so lookups never
+    block the event loop. Entry count and size are kept as running totals
+    rather than summed on every write.
+    """
+
+    def __init__(self, db_path: str = "thor_cache.db", ttl_seconds: int = 86400,
+                 max_bytes: int = 50 * 1024 * 1024):
+        self.db_path = Path(db_path)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.entries = 0
+        self.bytes = 0
+        self.db: Optional[Database] = None
+        self.logger = logging.getLogger(__name__)
+
+    async def _database(self) -> Database:
+        """Open the cache database on first use"""
+        if self.db is None or self.db.writer is None:
+            db = await open_database(self.db_path, readers=1)
+            await db.migrate(CACHE_MIGRATIONS)
+            self.entries, self.bytes = await db.fetchone(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+            )
+            self.db = db
+        return self.db
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get a cached response, or None if missing or expired"""
+        db = await self._database()
+        now = time.time()
+        row = await db.fetchone(
+            "SELECT value FROM responses WHERE key = ? AND created_at > ?",
+            (key, now - self.ttl_seconds)
+        )
+        if row is None:
+            self.misses += 1
+            return None
+
+        await db.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        self.hits += 1
+        return json.loads(row[0])
+
+    async def put(self, key: str, value: Dict[str, Any]):
+        """Store a response and evict expired or least recently used entries"""
+        db = await self._database()
+        data = json.dumps(value, default=str)
+        now = time.time()
+        async with db.transaction() as conn:
+            async with conn.execute("SELECT size FROM responses WHERE key = ?", (key,)) as cursor:
+                previous = await cursor.fetchone()
+            await conn.execute("""
+                INSERT OR REPLACE INTO responses (key, value, size, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            """, (key, data, len(data), now, now))
+            entries = self.entries + (0 if previous else 1)
+            size = self.bytes + len(data) - (previous[0] if previous else 0)
+            entries, size = await self._evict(conn, now, entries, size)
+        self.entries, self.bytes = entries, size
+
+    async def _evict(self, conn, now: float, entries: int, size: int) -> Tuple[int, int]:
+        """Delete expired entries, then least recently used ones over max_bytes; returns the new totals"""
+        cutoff = now - self.ttl_seconds
+        async with conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses WHERE created_at <= ?", (cutoff,)
+        ) as cursor:
+            expired, expired_size = await cursor.fetchone()
+        if expired:
+            await conn.execute("DELETE FROM responses WHERE created_at <= ?", (cutoff,))
+            entries -= expired
+            size -= expired_size
+
+        if size <= self.max_bytes:
+            return entries, size
+
+        # Other processes may share the file; resync before deleting anything
+        async with conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses") as cursor:
+            entries, size = await cursor.fetchone()
+
+        async with conn.execute("SELECT key, size FROM responses ORDER BY last_access ASC") as cursor:
+            candidates = await cursor.fetchall()
+
+        evicted = 0
+        for key, entry_size in candidates:
+            if size <= self.max_bytes:
+                break
+            await conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            entries -= 1
+            size -= entry_size
+            evicted += 1
+        if evicted:
+            self.logger.info(f"Response cache evicted {evicted} entries")
+        return entries, size
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self.entries,
+            "bytes": self.bytes
+        }
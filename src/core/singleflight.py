@@ -0,0 +1,97 @@
+# src/core/singleflight.py
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """One upstream stream replayed to every subscriber"""
+
+    def __init__(self):
+        self.events: List[Any] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.changed = asyncio.Condition()
+        self.task: Optional[asyncio.Task] = None
+
+
+class SingleFlight:
+    """Coalesce concurrent streams with the same key into one upstream call.
+
+    The first caller for a key starts the upstream stream; callers that
+    arrive while it's still running get every event from the start,
+    including the ones already produced. The upstream is cancelled only
+    if every subscriber goes away.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    def join(self, key: str, factory: Callable[[], AsyncIterator[Any]]) -> Tuple[AsyncIterator[Any], bool]:
+        """Subscribe to the flight for key, starting it if needed.
+
+        Returns (events, is_leader); only the leader's caller should
+        account for the upstream cost.
+        """
+        flight = self._flights.get(key)
+        is_leader = flight is None
+        if is_leader:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._run(key, flight, factory))
+        else:
+            logger.info("Coalesced identical in-flight request")
+
+        flight.subscribers += 1
+        return self._subscribe(key, flight), is_leader
+
+    async def _run(self, key: str, flight: _Flight, factory: Callable[[], AsyncIterator[Any]]):
+        try:
+            async for event in factory():
+                async with flight.changed:
+                    flight.events.append(event)
+                    flight.changed.notify_all()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+    async def _subscribe(self, key: str, flight: _Flight) -> AsyncIterator[Any]:
+        index = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: len(flight.events) > index or flight.done)
+                    pending = flight.events[index:]
+                    finished = flight.done
+
+                for event in pending:
+                    yield event
+                index += len(pending)
+
+                if finished and index >= len(flight.events):
+                    if flight.error is not None and not isinstance(flight.error, asyncio.CancelledError):
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task:
+                # Nobody is listening any more; stop paying for the upstream
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+
+    def in_flight(self) -> int:
+        """Number of upstream calls currently running"""
+        return len(self._flights)
+
+
+# Process-wide group so every ThorClient coalesces against the others
+shared_singleflight = SingleFlight()
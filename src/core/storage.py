@@ -0,0 +1,230 @@
+# src/core/storage.py
+import asyncio
+import itertools
+import logging
+import sqlite3
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence
+
+import aiosqlite
+
+logger = logging.getLogger(__name__)
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+# Prepared statements kept per connection
+CACHED_STATEMENTS = 256
+
+# Applied to every connection; the page cache size is in KiB when negative
+CONNECTION_PRAGMAS = (
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 268435456",
+    # INSERT OR REPLACE then fires delete triggers, which keep FTS indexes right
+    "PRAGMA recursive_triggers = ON",
+)
+
+
+class Database:
+    """One SQLite file behind a long-lived writer and a small pool of readers.
+
+    Each aiosqlite connection runs its queries on its own thread, so
+    nothing blocks the event loop. The file is in WAL mode: readers never
+    wait for the writer, and other THOR processes sharing the file wait up
+    to busy_timeout_ms for the write lock instead of failing.
+    """
+
+    def __init__(self, path: Path, readers: int = 2, synchronous: str = "NORMAL",
+                 busy_timeout_ms: int = 5000):
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Unknown synchronous mode: {synchronous}")
+        self.path = Path(path)
+        self.reader_count = max(1, readers)
+        self.synchronous = synchronous
+        self.busy_timeout_ms = busy_timeout_ms
+        self.writer: Optional[aiosqlite.Connection] = None
+        self.readers: List[aiosqlite.Connection] = []
+        self._next_reader = None
+        self._open_task: Optional[asyncio.Future] = None
+        self._close_hooks: List[Callable[[], Awaitable[Any]]] = []
+        # Connections outlive any one event loop, but asyncio locks don't
+        self._write_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+            weakref.WeakKeyDictionary()
+        )
+
+    async def open(self):
+        """Connect the writer and readers; safe to call more than once"""
+        if self._open_task is None:
+            self._open_task = asyncio.ensure_future(self._open())
+        try:
+            await self._open_task
+        except Exception:
+            self._open_task = None
+            raise
+
+    async def _open(self):
+        writer = await self._connect()
+        try:
+            await _pragma(writer, "PRAGMA journal_mode = WAL")
+            readers = [await self._connect(read_only=True) for _ in range(self.reader_count)]
+        except Exception:
+            await writer.close()
+            raise
+
+        self.writer = writer
+        self.readers = readers
+        self._next_reader = itertools.cycle(readers)
+        logger.info(f"Opened {self.path} with {len(readers)} readers (synchronous={self.synchronous})")
+
+    async def _connect(self, read_only: bool = False) -> aiosqlite.Connection:
+        # isolation_level=None: transactions are begun explicitly by transaction()
+        conn = await aiosqlite.connect(self.path, isolation_level=None,
+                                       cached_statements=CACHED_STATEMENTS)
+        try:
+            await _pragma(conn, f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+            await _pragma(conn, f"PRAGMA synchronous = {self.synchronous}")
+            for pragma in CONNECTION_PRAGMAS:
+                await _pragma(conn, pragma)
+            if read_only:
+                await _pragma(conn, "PRAGMA query_only = ON")
+        except Exception:
+            await conn.close()
+            raise
+        return conn
+
+    def on_close(self, hook: Callable[[], Awaitable[Any]]):
+        """Await hook() before the connections close, e.g. to flush buffered writes"""
+        if hook not in self._close_hooks:
+            self._close_hooks.append(hook)
+
+    async def close(self):
+        """Run the close hooks, then close every connection"""
+        hooks, self._close_hooks = self._close_hooks, []
+        for hook in hooks:
+            try:
+                await hook()
+            except Exception as e:
+                logger.error(f"Error in close hook for {self.path}: {e}")
+
+        connections = ([self.writer] if self.writer else []) + self.readers
+        self.writer = None
+        self.readers = []
+        self._next_reader = None
+        self._open_task = None
+        for conn in connections:
+            try:
+                await conn.close()
+            except Exception as e:
+                logger.error(f"Error closing connection to {self.path}: {e}")
+
+    def _write_lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._write_locks.get(loop)
+        if lock is None:
+            lock = self._write_locks[loop] = asyncio.Lock()
+        return lock
+
+    def _reader(self) -> aiosqlite.Connection:
+        if self._next_reader is None:
+            raise RuntimeError(f"Database {self.path} is not open")
+        return next(self._next_reader)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[aiosqlite.Connection]:
+        """async with db.transaction() as conn: ... - committed on success, rolled back on error"""
+        if self.writer is None:
+            raise RuntimeError(f"Database {self.path} is not open")
+        async with self._write_lock():
+            # IMMEDIATE takes the write lock up front, so busy_timeout applies
+            # here rather than as a failure halfway through
+            try:
+                await self.writer.execute("BEGIN IMMEDIATE")
+            except asyncio.CancelledError:
+                # The BEGIN still runs on the connection's thread; undo it so
+                # the writer isn't left inside a transaction
+                try:
+                    await asyncio.shield(self.writer.execute("ROLLBACK"))
+                except sqlite3.OperationalError:
+                    pass
+                raise
+            try:
+                yield self.writer
+            except BaseException:
+                await asyncio.shield(self.writer.execute("ROLLBACK"))
+                raise
+            await asyncio.shield(self.writer.execute("COMMIT"))
+
+    async def execute(self, sql: str, params: Sequence[Any] = ()):
+        """Run one write statement in its own transaction"""
+        async with self.transaction() as conn:
+            async with conn.execute(sql, params):
+                pass
+
+    async def migrate(self, migrations: Sequence[Sequence[str]]) -> int:
+        """Apply the migrations the file hasn't had yet; returns the schema version.
+
+        migrations[i] holds the statements that take the schema from version
+        i to i + 1, tracked in PRAGMA user_version. Everything pending runs
+        in one write transaction, so a process that starts at the same time
+        waits and then finds nothing left to do.
+        """
+        async with self.transaction() as conn:
+            async with conn.execute("PRAGMA user_version") as cursor:
+                version = (await cursor.fetchone())[0]
+            if version > len(migrations):
+                logger.warning(f"{self.path} is at schema version {version}, newer than this THOR "
+                               f"({len(migrations)}); leaving it as is")
+                return version
+
+            for number in range(version + 1, len(migrations) + 1):
+                for statement in migrations[number - 1]:
+                    await conn.execute(statement)
+                logger.info(f"Migrated {self.path} to schema version {number}")
+            if version < len(migrations):
+                await conn.execute(f"PRAGMA user_version = {len(migrations)}")
+        return max(version, len(migrations))
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        async with self._reader().execute(sql, params) as cursor:
+            return await cursor.fetchone()
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        async with self._reader().execute(sql, params) as cursor:
+            return list(await cursor.fetchall())
+
+
+async def _pragma(conn: aiosqlite.Connection, sql: str):
+    # Pragmas that return a row hold their statement open until it's consumed
+    async with conn.execute(sql) as cursor:
+        await cursor.fetchall()
+
+
+# One Database per file for the whole process, so every ThorClient (CLI,
+# WebSocket bridge, swarm sessions) shares the same writer and readers.
+_databases: Dict[Path, Database] = {}
+_databases_lock = threading.Lock()
+
+
+async def open_database(path: Path, **options: Any) -> Database:
+    """Get the shared, opened Database for a file; options apply on first open"""
+    key = Path(path).resolve()
+    with _databases_lock:
+        db = _databases.get(key)
+        if db is None:
+            db = _databases[key] = Database(key, **options)
+    await db.open()
+    return db
+
+
+async def close_databases():
+    """Close all shared databases"""
+    with _databases_lock:
+        databases = list(_databases.values())
+        _databases.clear()
+
+    for db in databases:
+        await db.close()
@@ -0,0 +1,122 @@
+# src/core/terminal_renderer.py
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from rich.console import Console, Group
+from rich.live import Live
+from rich.markdown import Markdown
+from rich.spinner import Spinner
+from rich.text import Text
+
+# Longest tool result shown inline; the model still gets the full output
+MAX_TOOL_PREVIEW = 120
+
+
+class TerminalRenderer:
+    """Render a streamed chat turn in the terminal with rich.
+
+    Events only update state; a single asyncio task redraws the Live
+    display at a fixed rate, so rendering never blocks the stream and
+    there's no spinner thread. The live region is cropped to the terminal
+    and cleared on exit; the finished turn is then printed once in full.
+    Use as an async context manager and feed it chat_stream events.
+    """
+
+    def __init__(self, console: Optional[Console] = None, refresh_per_second: float = 10):
+        self.console = console or Console()
+        self.interval = 1.0 / refresh_per_second
+        self.text = ""
+        self.tool_lines: List[str] = []
+        self.phase = "api"
+        self.phase_started = time.perf_counter()
+        self.elapsed = {"api": 0.0, "tools": 0.0, "memory": 0.0}
+        self.result: Optional[Dict[str, Any]] = None
+        self.cancelled = False
+        self._spinner = Spinner("dots", style="cyan")
+        self._live: Optional[Live] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def __aenter__(self) -> "TerminalRenderer":
+        # A "visible" overflow can't be cleared, so a tall answer would be
+        # re-emitted on every refresh
+        self._live = Live(self._render(), console=self.console, auto_refresh=False,
+                          vertical_overflow="ellipsis", transient=True)
+        self._live.start(refresh=True)
+        self._task = asyncio.ensure_future(self._refresh_loop())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+        self.cancelled = exc_type is not None and issubclass(exc_type, asyncio.CancelledError)
+        # stop() redraws uncropped; blank the region first so that redraw
+        # can't overflow either
+        self._live.update(Text(""), refresh=False)
+        self._live.stop()
+        self.console.print(self._render())
+        return False
+
+    def handle(self, event: Dict[str, Any]):
+        """Apply a chat_stream event"""
+        if event["type"] == "text_delta":
+            self.text += event["text"]
+        elif event["type"] == "tool_use":
+            self._switch_phase("tools")
+            self.tool_lines.append(f"🔧 Running {event['name']}...")
+        elif event["type"] == "tool_result":
+            self._switch_phase("api")
+            preview = str(event["result"]).strip().splitlines()[0] if str(event["result"]).strip() else ""
+            if len(preview) > MAX_TOOL_PREVIEW:
+                preview = preview[:MAX_TOOL_PREVIEW] + "…"
+            self.tool_lines.append(f"{'❌' if event.get('is_error') else '🔧'} {event['name']}: {preview}")
+        elif event["type"] == "error":
+            self.tool_lines.append(f"❌ {event['error']}")
+        elif event["type"] == "done":
+            self.result = event
+            if not self.text:
+                self.text = event.get("response", "")
+
+    def _switch_phase(self, phase: str):
+        now = time.perf_counter()
+        self.elapsed[self.phase] += now - self.phase_started
+        self.phase = phase
+        self.phase_started = now
+
+    def _timings(self) -> Dict[str, float]:
+        """Authoritative timings once the turn is done, a live estimate before"""
+        if self.result and self.result.get("timings"):
+            return self.result["timings"]
+        timings = dict(self.elapsed)
+        timings[self.phase] += time.perf_counter() - self.phase_started
+        return timings
+
+    def status_line(self) -> str:
+        """Per-phase timings, plus the cost once the turn is done"""
+        parts = [f"{phase} {seconds:.2f}s" for phase, seconds in self._timings().items()]
+        if self.result and self.result.get("cost"):
+            parts.append(f"${self.result['cost']:.4f}")
+        return " · ".join(parts)
+
+    def _render(self) -> Group:
+        renderables = [Text(line, style="dim") for line in self.tool_lines]
+        if self.text:
+            renderables.append(Markdown(self.text))
+
+        if self.cancelled:
+            renderables.append(Text(f"🛑 Cancelled · {self.status_line()}", style="yellow"))
+        elif self.result is not None:
+            renderables.append(Text(f"⏱  {self.status_line()}", style="dim"))
+        else:
+            self._spinner.text = Text(f"THOR is thinking... {self.status_line()}", style="dim")
+            renderables.append(self._spinner)
+        return Group(*renderables)
+
+    async def _refresh_loop(self):
+        while True:
+            self._live.update(self._render(), refresh=True)
+            await asyncio.sleep(self.interval)
@@ -1,19 +1,43 @@
-# src/core/thor_client.py - FINAL NO-STREAMING VERSION
+# src/core/thor_client.py
 import asyncio
 import anthropic
 import json
 import logging
 import time
-from typing import Dict, List, Optional, Any
+import functools
+import hashlib
+from typing import Dict, List, Optional, Any, AsyncIterator
 from datetime import datetime
 import threading
 import signal
 import sys
+from types import SimpleNamespace
 
 from .config import ConfigManager
-from .model_selector import ModelSelector
-from .memory_manager import MemoryManager
+from .model_selector import ModelSelector, CONFIDENCE_INSTRUCTION
+from .memory_manager import MemoryManager, format_search_results
 from .file_operations import FileOperations
+from .api_transport import get_async_client
+from .tool_registry import tool, tool_registry
+from .context_builder import ContextBuilder, estimate_tokens
+from .attachments import attachment_refs
+from .response_cache import ResponseCache, request_fingerprint
+from .singleflight import shared_singleflight
+from .rate_limiter import get_rate_limiter
+from .hedging import HedgePolicy
+from .metrics import metrics
+
+# Output token cap per API call
+MAX_OUTPUT_TOKENS = 4000
+
+# Rate limited (429) and overloaded (529) responses are retried with backoff
+RETRYABLE_STATUS_CODES = {429, 529}
+
+# Tools that already bound their output by paging; never spilled
+SELF_PAGING_TOOLS = {"read_file", "read_artifact_range"}
+
+# Largest page read_artifact_range returns
+ARTIFACT_PAGE_CHARS = 8000
 
 class ThorClient:
     """THOR client with reliable API calls"""
@@ -27,34 +51,57 @@ class ThorClient:
         if not self.config_manager.config.api_key:
             raise ValueError("ANTHROPIC_API_KEY not found. Please set it in your environment.")
         
-        self.client = anthropic.Anthropic(api_key=self.config_manager.config.api_key)
+        # Shared async client: one keep-alive connection pool per process
+        self.client = get_async_client(self.config_manager.config.api_key)
         self.logger = logging.getLogger(__name__)
         
         # State management
         self.kill_flag = threading.Event()
-        self.thinking_indicator = False
         
         # Initialize enhanced system prompt
         self.system_prompt = self._build_enhanced_system_prompt()
         
-        # Tools registry
-        self.tools = {
-            'read_file': self._tool_read_file,
-            'write_file': self._tool_write_file,
-            'list_files': self._tool_list_files,
-            'create_directory': self._tool_create_directory,
-            'run_command': self._tool_run_command,
-            'search_files': self._tool_search_files,
-            'analyze_code': self._tool_analyze_code,
-            'get_memory': self._tool_get_memory,
-            'save_artifact': self._tool_save_artifact,
-            'cost_check': self._tool_cost_check,
-            'swarm_status': self._tool_swarm_status
-        }
+        # Tools registry (schemas and validators built once at import)
+        self.tool_registry = tool_registry
+        
+        # Opt-in cache of complete responses keyed on the request content
+        config = self.config_manager.config
+        self.response_cache = None
+        if config.response_cache_enabled:
+            self.response_cache = ResponseCache(
+                ttl_seconds=config.response_cache_ttl,
+                max_bytes=config.response_cache_max_bytes
+            )
+        
+        # Identical concurrent requests share one upstream call
+        self.inflight = shared_singleflight
+        
+        # Client-side pacing shared by every client using this API key
+        self.rate_limiter = get_rate_limiter(
+            config.api_key,
+            config.api_rate_limit,
+            config.api_token_rate_limit,
+            config.max_parallel_tasks
+        )
+        
+        # Tail-latency hedging of slow-to-start upstream calls
+        self.hedge_policy = HedgePolicy(config.hedge_percentile, config.hedge_max_fraction)
+        
+        # History is packed into what's left after the prompt, tools and output
+        self.context_builder = ContextBuilder(reserved_tokens=(
+            MAX_OUTPUT_TOKENS
+            + estimate_tokens(self.system_prompt)
+            + estimate_tokens(self.tool_registry.schemas())
+            + estimate_tokens(self._build_request_context())
+        ))
     
     def _build_enhanced_system_prompt(self) -> str:
-        """Build comprehensive system prompt"""
-        return f"""You are THOR, an advanced AI development assistant with powerful capabilities.
+        """Build the stable system prompt.
+        
+        Kept free of per-request data so it can be served from the
+        provider's prompt cache; see _build_request_context.
+        """
+        return """You are THOR, an advanced AI development assistant with powerful capabilities.
 
 CORE CAPABILITIES:
 - File system operations (read/write/create/search)
@@ -73,77 +120,250 @@ OPERATIONAL GUIDELINES:
 - Follow software development best practices
 - Be helpful and thorough
 
-Current session: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-Daily budget used: ${self.model_selector.daily_usage['cost']:.4f} / ${self.config_manager.config.max_daily_spend:.2f}
-
 IMPORTANT: When asked to perform an action, USE THE TOOLS to actually do it."""
     
-    def start_thinking_indicator(self):
-        """Start thinking indicator"""
-        self.thinking_indicator = True
-        
-        def spinner():
-            chars = "⠋⠙⠹⠸⠼⠴⠦⠧⠇⠏"
-            i = 0
-            while self.thinking_indicator and not self.kill_flag.is_set():
-                print(f"\r🤖 THOR is thinking... {chars[i % len(chars)]}", end="", flush=True)
-                time.sleep(0.1)
-                i += 1
-            print("\r" + " " * 50 + "\r", end="", flush=True)
-        
-        threading.Thread(target=spinner, daemon=True).start()
+    def _build_request_context(self) -> str:
+        """Build the per-request part of the system prompt"""
+        return f"""Current session: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+Daily budget used: ${self.model_selector.daily_usage['cost']:.4f} / ${self.config_manager.config.max_daily_spend:.2f}"""
     
-    def stop_thinking_indicator(self):
-        """Stop thinking indicator"""
-        self.thinking_indicator = False
-        time.sleep(0.1)
+    def _build_system_blocks(self, instructions: str = "") -> List[Dict]:
+        """System prompt blocks with a cache breakpoint after the stable prefix"""
+        request_context = self._build_request_context()
+        if instructions:
+            request_context += "\n\n" + instructions
+        return [
+            {"type": "text", "text": self.system_prompt, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": request_context}
+        ]
     
     async def initialize(self):
         """Initialize THOR with all subsystems"""
         self.logger.info("Initializing THOR...")
         await self.memory_manager.load_memory()
+        
+        config = self.config_manager.config
+        if config.metrics_dump_path:
+            metrics.dump_to(config.metrics_dump_path)
+        if config.metrics_port:
+            try:
+                await metrics.start_server(config.metrics_host, config.metrics_port)
+            except OSError as e:
+                self.logger.error(f"Could not start metrics endpoint: {e}")
         self.logger.info("THOR initialization complete")
     
-    async def chat(self, message: str, session_id: str = "default") -> str:
+    async def chat(self, message: str, session_id: str = "default", pinned: bool = False) -> str:
         """Enhanced chat with proper API handling"""
         try:
-            self.start_thinking_indicator()
+            response = "No response received"
+            async for event in self.chat_stream(message, session_id, pinned=pinned):
+                if event["type"] == "done":
+                    response = event["response"]
+            
+            return response
             
+        except Exception as e:
+            self.logger.error(f"Chat error: {e}")
+            return f"❌ Error: {str(e)}"
+    
+    async def chat_stream(self, message: str, session_id: str = "default",
+                          pinned: bool = False) -> AsyncIterator[Dict[str, Any]]:
+        """Stream a chat turn as events.
+        
+        A pinned message is kept in the context of every later turn in the
+        session, however far back it is.
+        
+        Yields dicts with a "type" key:
+          text_delta  - {"text"} incremental model text
+          tool_use    - {"name", "input"} before a tool runs
+          tool_result - {"name", "result"} after it finishes
+          error       - {"error"} API or processing failure
+          done        - {"response", "usage", "cost", "timings"} the complete
+                        response text, summed token usage and cost, and
+                        seconds spent in each phase (api, tools, memory);
+                        always last
+        """
+        turn_usage = {}
+        input_cost = output_cost = 0.0
+        billed = False
+        try:
             # Check for kill signal
             if self.kill_flag.is_set():
-                self.stop_thinking_indicator()
-                return "🛑 Operation cancelled by user"
-            
-            # Task classification for model selection
-            task_type = self._classify_task(message)
-            model_name, model_config = self.model_selector.choose_model(task_type)
-            
-            # Get conversation history (API compatible format)
-            history = await self.memory_manager.get_conversation_history(session_id)
-            recent_history = history[-8:] if len(history) > 8 else history
+                yield {"type": "done", "response": "🛑 Operation cancelled by user"}
+                return
             
-            # Prepare messages for API
-            messages = recent_history + [{"role": "user", "content": message}]
-            
-            # Make API call
-            response = await self._make_api_call(messages, model_config)
-            
-            # Update memory
-            await self.memory_manager.add_to_conversation(session_id, message, response)
+            model_name = None
+            timings = {"api": 0.0, "tools": 0.0, "memory": 0.0}
+            # Memory is only written at the end of the turn; a cancelled turn
+            # undoes artifact writes its tools made along the way
+            async with self.memory_manager.turn():
+                # Task classification for model selection
+                with metrics.span("classification"):
+                    task_type = self._classify_task(message)
+                    model_name, model_config = self.model_selector.choose_model(task_type)
+                
+                # Cascade mode: the fast model answers first, escalating if needed
+                cascade = self.model_selector.cascade_plan(task_type)
+                escalated_from = None
+                cascade_latency = 0.0
+                if cascade:
+                    model_name = cascade[0]
+                    model_config = self.config_manager.config.model_configs[model_name]
+                
+                # Get conversation history (API compatible format)
+                with metrics.span("history_fetch") as span:
+                    history = await self.memory_manager.get_conversation_history(session_id)
+                    attachments = await self.memory_manager.get_attachments([
+                        digest for msg in history + [{"content": message}]
+                        for digest, _ in attachment_refs(msg["content"])
+                    ])
+                timings["memory"] += span.seconds
+                
+                # Prepare messages for API within the model's token budget
+                with metrics.span("context_build"):
+                    messages = self.context_builder.build(history, message, model_config,
+                                                          attachments=attachments)
+                
+                # Agent loop: feed tool results back until the model ends its turn
+                max_steps = self.config_manager.config.max_agent_steps
+                response_parts = []
+                for step in range(max_steps):
+                    # A cascading step may be redone once by the larger model
+                    while True:
+                        final_message = None
+                        api_error = None
+                        instructions = CONFIDENCE_INSTRUCTION if cascade else ""
+                        first_token = None
+                        with metrics.span("upstream_total", model=model_name) as span:
+                            async for event in self._make_api_call(messages, model_config, instructions, model_name):
+                                if first_token is None:
+                                    first_token = time.perf_counter() - span.started
+                                    metrics.observe("upstream_ttfb", first_token, model=model_name)
+                                if event["type"] == "stream_start":
+                                    # Only marks the first token for timing and hedging
+                                    continue
+                                elif event["type"] == "message":
+                                    final_message = event["message"]
+                                elif cascade and event["type"] == "text_delta":
+                                    # Held back until the fast model's answer is accepted
+                                    continue
+                                else:
+                                    if event["type"] == "error":
+                                        api_error = event["error"]
+                                    yield event
+                        call_latency = span.seconds
+                        timings["api"] += call_latency
+                        
+                        if final_message is None:
+                            self.model_selector.telemetry.record(model_name, task_type, call_latency, error=True)
+                            yield {"type": "done", "response": f"❌ API Error: {api_error or 'no response received'}"}
+                            return
+                        
+                        # Ledger from the response's actual token usage
+                        call_usage = self._usage_to_dict(final_message)
+                        for key, value in call_usage.items():
+                            turn_usage[key] = turn_usage.get(key, 0) + value
+                        call_input_cost, call_output_cost = self.model_selector.cost_breakdown(model_name, call_usage)
+                        input_cost += call_input_cost
+                        output_cost += call_output_cost
+                        if getattr(final_message, "usage", None) is not None:
+                            # Upstream calls only; cache hits and coalesced followers would skew latency
+                            self.model_selector.telemetry.record(
+                                model_name, task_type, call_latency,
+                                output_tokens=call_usage["output_tokens"], first_token=first_token
+                            )
+                        
+                        texts = [block.text for block in final_message.content if block.type == "text"]
+                        if not cascade:
+                            if escalated_from is not None:
+                                self.model_selector.record_cascade(task_type, True, escalated_from + call_latency)
+                                escalated_from = None
+                            break
+                        
+                        # Cascade: keep the fast model's steps unless it plans heavy tool
+                        # use or is unsure of its final answer
+                        cascade_latency += call_latency
+                        text, confidence = self.model_selector.parse_confidence("\n".join(texts))
+                        tool_count = sum(1 for block in final_message.content if block.type == "tool_use")
+                        if not self.model_selector.should_escalate(confidence, tool_count):
+                            if not tool_count:
+                                self.model_selector.record_cascade(task_type, False, cascade_latency)
+                                cascade = None
+                            texts = [text]
+                            if text:
+                                yield {"type": "text_delta", "text": text}
+                            break
+                        
+                        cascade_to = cascade[1]
+                        cascade = None
+                        self.logger.info(f"Escalating {task_type} from {model_name} to {cascade_to} "
+                                         f"(confidence {confidence}, {tool_count} tool calls)")
+                        escalated_from = cascade_latency
+                        model_name, model_config = cascade_to, self.config_manager.config.model_configs[cascade_to]
+                    
+                    response_parts.extend(texts)
+                    tool_calls = [block for block in final_message.content if block.type == "tool_use"]
+                    if final_message.stop_reason != "tool_use" or not tool_calls:
+                        break
+                    if step == max_steps - 1:
+                        # No step left to show the model the results, so don't run them
+                        skipped = ", ".join(block.name for block in tool_calls)
+                        self.logger.warning(f"Agent loop stopped after {max_steps} steps; skipped {skipped}")
+                        response_parts.append(f"⚠️ Stopped after {max_steps} tool steps; skipped: {skipped}")
+                        break
+                
+                    # Independent tool calls from one response run concurrently
+                    for block in tool_calls:
+                        yield {"type": "tool_use", "name": block.name, "input": block.input}
+                    with metrics.span("tools") as span:
+                        results = await asyncio.gather(
+                            *(self._handle_tool_call(block.name, block.input) for block in tool_calls)
+                        )
+                    timings["tools"] += span.seconds
+                
+                    tool_results = []
+                    for block, (result, is_error) in zip(tool_calls, results):
+                        yield {"type": "tool_result", "name": block.name, "result": result, "is_error": is_error}
+                        tool_results.append({
+                            "type": "tool_result",
+                            "tool_use_id": block.id,
+                            "content": str(result),
+                            "is_error": is_error
+                        })
+                
+                    messages.append({"role": "assistant", "content": self._content_to_params(final_message.content)})
+                    messages.append({"role": "user", "content": tool_results})
+                
+                response = "\n".join(part for part in response_parts if part) or "No response received"
+                
+                # Update memory
+                with metrics.span("memory_write") as span:
+                    await self.memory_manager.add_to_conversation(
+                        session_id, message, response,
+                        usage=turn_usage, costs=(input_cost, output_cost), pinned=pinned
+                    )
+                timings["memory"] += span.seconds
             
             # Update cost tracking
-            estimated_cost = self.model_selector.estimate_cost(
-                len(str(messages)), len(response), model_name
-            )
-            self.model_selector.update_usage(estimated_cost)
+            self.model_selector.update_usage(input_cost + output_cost, turn_usage)
+            billed = True
             
-            self.stop_thinking_indicator()
-            return response
+            yield {"type": "done", "response": response, "usage": turn_usage,
+                   "cost": input_cost + output_cost, "timings": timings}
             
+        except asyncio.CancelledError:
+            self.logger.info("Chat turn cancelled")
+            raise
+        
         except Exception as e:
-            self.stop_thinking_indicator()
             self.logger.error(f"Chat error: {e}")
-            return f"❌ Error: {str(e)}"
+            yield {"type": "error", "error": str(e)}
+            yield {"type": "done", "response": f"❌ Error: {str(e)}"}
+        
+        finally:
+            # Tokens already generated are billed even if the turn fails or is dropped
+            if turn_usage and not billed:
+                self.model_selector.update_usage(input_cost + output_cost, turn_usage)
     
     def _classify_task(self, message: str) -> str:
         """Classify task for optimal model selection"""
@@ -158,132 +378,328 @@ IMPORTANT: When asked to perform an action, USE THE TOOLS to actually do it."""
         else:
             return "general"
     
-    async def _make_api_call(self, messages: List[Dict], model_config) -> str:
-        """Make synchronous API call with tools"""
+    async def _make_api_call(self, messages: List[Dict], model_config, instructions: str = "",
+                             model_name: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Stream an API call with tools.
+        
+        Yields a stream_start event once the response begins, text_delta
+        events as tokens arrive, then a single {"type": "message"} event
+        carrying the final SDK message.
+        Requests identical to one already in flight share its stream.
+        instructions are appended to the per-request system block;
+        model_name (the config alias) enables hedging for that model.
+        """
+        # The per-request context block is left out of the fingerprint;
+        # it only carries the clock and budget figures
+        fingerprint = request_fingerprint(
+            model=model_config.name,
+            system=self.system_prompt,
+            messages=messages,
+            tools=self.tool_registry.schemas(),
+            max_tokens=MAX_OUTPUT_TOKENS,
+            **({"instructions": instructions} if instructions else {})
+        )
+        
+        if self.response_cache:
+            cached = await self.response_cache.get(fingerprint)
+            if cached is not None:
+                self.logger.info(f"Response cache hit ({model_config.name})")
+                final_message = self._message_from_cache(cached)
+                for block in final_message.content:
+                    if block.type == "text":
+                        yield {"type": "text_delta", "text": block.text}
+                yield {"type": "message", "message": final_message}
+                return
+        
+        upstream = functools.partial(self._stream_upstream, messages, model_config, fingerprint, instructions)
+        if self.config_manager.config.hedging_enabled and model_name:
+            upstream = functools.partial(self._hedged_upstream, upstream, messages, model_name)
+        if self.config_manager.config.request_coalescing:
+            events, is_leader = self.inflight.join(fingerprint, upstream)
+        else:
+            events, is_leader = upstream(), True
+        
+        async for event in events:
+            if event["type"] == "message" and not is_leader:
+                # The leader accounts for the tokens; followers rode along
+                message = event["message"]
+                event = {"type": "message", "message": SimpleNamespace(
+                    content=message.content, stop_reason=message.stop_reason, usage=None
+                )}
+            yield event
+    
+    def _hedged_upstream(self, upstream, messages: List[Dict], model_name: str) -> AsyncIterator[Dict[str, Any]]:
+        """Race upstream() against a duplicate if it's slow to produce a first token"""
+        delay = self.hedge_policy.delay(self.model_selector.telemetry.first_token_latencies(model_name))
+        
+        def loser_cost() -> float:
+            # The abandoned call is billed for its prompt at least; it's
+            # the same request as the winner, so it isn't counted again
+            estimated = {"input_tokens": estimate_tokens(messages) + self.context_builder.reserved_tokens - MAX_OUTPUT_TOKENS}
+            cost = sum(self.model_selector.cost_breakdown(model_name, estimated))
+            self.model_selector.update_usage(cost, estimated, count_request=False)
+            return cost
+        
+        return self.hedge_policy.race(upstream, delay, on_loser=loser_cost)
+    
+    async def _stream_upstream(self, messages: List[Dict], model_config, fingerprint: str,
+                               instructions: str = "") -> AsyncIterator[Dict[str, Any]]:
+        """Stream one request from the API and store it in the response cache.
+        
+        Requests are paced by the rate limiter; 429/529 responses shrink its
+        concurrency window and are retried with jittered backoff as long as
+        nothing has been streamed yet.
+        """
+        max_retries = self.config_manager.config.max_retries
+        estimated_tokens = estimate_tokens(messages) + self.context_builder.reserved_tokens
+        
+        for attempt in range(max_retries + 1):
+            streamed = False
+            try:
+                async with self.rate_limiter.slot(model_config.name, estimated_tokens):
+                    # Streamed on the shared async client so other sessions keep running
+                    async with self.client.messages.stream(
+                        model=model_config.name,
+                        max_tokens=MAX_OUTPUT_TOKENS,
+                        system=self._build_system_blocks(instructions),
+                        messages=messages,
+                        tools=self.tool_registry.schemas()
+                    ) as stream:
+                        started = False
+                        async for event in stream:
+                            if not started and event.type in ("message_start", "content_block_start"):
+                                # The response has begun, even if it opens with a tool call
+                                started = True
+                                yield {"type": "stream_start"}
+                            elif event.type == "content_block_delta" and event.delta.type == "text_delta":
+                                streamed = True
+                                yield {"type": "text_delta", "text": event.delta.text}
+                        
+                        final_message = await stream.get_final_message()
+                
+                self.rate_limiter.on_success(model_config.name)
+                break
+                
+            except anthropic.APIStatusError as e:
+                if e.status_code not in RETRYABLE_STATUS_CODES or streamed or attempt == max_retries:
+                    self.logger.error(f"API call error: {e}")
+                    yield {"type": "error", "error": str(e)}
+                    return
+                
+                retry_after = self._retry_after(e)
+                self.rate_limiter.on_overload(model_config.name, retry_after)
+                delay = self.rate_limiter.backoff_delay(attempt, retry_after)
+                self.logger.warning(f"API returned {e.status_code}; retry {attempt + 1}/{max_retries} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                
+            except Exception as e:
+                self.logger.error(f"API call error: {e}")
+                yield {"type": "error", "error": str(e)}
+                return
+        
+        usage = self._usage_to_dict(final_message)
+        self.rate_limiter.record_tokens(model_config.name, usage["input_tokens"] - estimated_tokens)
+        self.logger.info(
+            f"API usage ({model_config.name}): input={usage['input_tokens']} "
+            f"output={usage['output_tokens']} cache_read={usage['cache_read_input_tokens']} "
+            f"cache_write={usage['cache_creation_input_tokens']}"
+        )
+        
+        if self.response_cache:
+            await self.response_cache.put(fingerprint, {
+                "content": self._content_to_params(final_message.content),
+                "stop_reason": final_message.stop_reason
+            })
+        
+        yield {"type": "message", "message": final_message}
+    
+    def _retry_after(self, error) -> Optional[float]:
+        """Seconds to wait from a Retry-After header, if the server sent one"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
         try:
-            # Tool definitions
-            tools = [
-                {
-                    "name": "read_file",
-                    "description": "Read contents of a file",
-                    "input_schema": {
-                        "type": "object",
-                        "properties": {
-                            "file_path": {"type": "string", "description": "Path to the file to read"}
-                        },
-                        "required": ["file_path"]
-                    }
-                },
-                {
-                    "name": "write_file",
-                    "description": "Write content to a file",
-                    "input_schema": {
-                        "type": "object",
-                        "properties": {
-                            "file_path": {"type": "string", "description": "Path to the file to write"},
-                            "content": {"type": "string", "description": "Content to write to the file"}
-                        },
-                        "required": ["file_path", "content"]
-                    }
-                },
-                {
-                    "name": "list_files",
-                    "description": "List files in a directory",
-                    "input_schema": {
-                        "type": "object",
-                        "properties": {
-                            "directory": {"type": "string", "description": "Directory path", "default": "."}
-                        }
-                    }
-                },
-                {
-                    "name": "run_command",
-                    "description": "Run a system command",
-                    "input_schema": {
-                        "type": "object",
-                        "properties": {
-                            "command": {"type": "string", "description": "Command to run"}
-                        },
-                        "required": ["command"]
-                    }
-                }
-            ]
-            
-            # Make synchronous API call
-            response = self.client.messages.create(
-                model=model_config.name,
-                max_tokens=4000,
-                system=self.system_prompt,
-                messages=messages,
-                tools=tools
-            )
-            
-            # Process response
-            if response.stop_reason == "tool_use":
-                return await self._handle_tool_calls(response)
-            
-            return response.content[0].text if response.content else "No response received"
-            
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except (TypeError, ValueError):
+            pass
+        return None
+    
+    def _message_from_cache(self, cached: Dict) -> SimpleNamespace:
+        """Rebuild a response from the cache; hits carry no token usage"""
+        return SimpleNamespace(
+            content=[SimpleNamespace(**block) for block in cached["content"]],
+            stop_reason=cached["stop_reason"],
+            usage=None
+        )
+    
+    async def call_tool(self, tool_name: str, tool_args: Optional[Dict] = None) -> Any:
+        """Run a registered tool by name; shared by every dispatcher"""
+        return await self.tool_registry.dispatch(self, tool_name, tool_args)
+    
+    async def _handle_tool_call(self, tool_name: str, tool_input: Dict) -> tuple:
+        """Run a single tool call from the model, returning (result, is_error)"""
+        if tool_name not in self.tool_registry:
+            return f"❌ Unknown tool: {tool_name}", True
+        
+        try:
+            with metrics.span("tool", tool=tool_name):
+                result = await self.call_tool(tool_name, tool_input)
         except Exception as e:
-            self.logger.error(f"API call error: {e}")
-            return f"❌ API Error: {str(e)}"
+            return f"❌ {tool_name} error: {str(e)}", True
+        
+        if tool_name not in SELF_PAGING_TOOLS:
+            result = await self._spill_large_output(tool_name, result)
+        return result, False
     
-    async def _handle_tool_calls(self, response) -> str:
-        """Handle tool calls from API response"""
-        results = []
+    async def _spill_large_output(self, tool_name: str, result: Any) -> Any:
+        """Store an oversized tool result as an artifact; the model gets head, tail and a handle"""
+        limit = self.config_manager.config.tool_output_limit
+        if not isinstance(result, str) or len(result) <= limit:
+            return result
         
-        for content_block in response.content:
-            if content_block.type == "tool_use":
-                tool_name = content_block.name
-                tool_input = content_block.input
-                
-                if tool_name in self.tools:
-                    try:
-                        if asyncio.iscoroutinefunction(self.tools[tool_name]):
-                            result = await self.tools[tool_name](**tool_input)
-                        else:
-                            result = self.tools[tool_name](**tool_input)
-                        results.append(f"🔧 {tool_name}: {result}")
-                    except Exception as e:
-                        results.append(f"❌ {tool_name} error: {str(e)}")
-                else:
-                    results.append(f"❌ Unknown tool: {tool_name}")
-            elif content_block.type == "text":
-                results.append(content_block.text)
-        
-        return "\n".join(results)
+        handle = f"tool-output/{tool_name}/{hashlib.sha256(result.encode('utf-8')).hexdigest()[:16]}"
+        await self.memory_manager.save_artifact(handle, result, "tool_output", cache=False)
+        self.logger.info(f"Spilled {len(result)} characters of {tool_name} output to {handle}")
+        
+        head, tail = result[:limit // 2], result[-(limit // 4):]
+        omitted = len(result) - len(head) - len(tail)
+        return (f"{head}\n\n[... {omitted} characters omitted; the full output ({len(result)} characters) "
+                f"is artifact '{handle}'. Page through it with read_artifact_range ...]\n\n{tail}")
+    
+    def _usage_to_dict(self, message) -> Dict[str, int]:
+        """Token counts from a response, including prompt cache reads/writes"""
+        usage = getattr(message, "usage", None)
+        return {
+            key: getattr(usage, key, 0) or 0
+            for key in ("input_tokens", "output_tokens",
+                        "cache_creation_input_tokens", "cache_read_input_tokens")
+        }
+    
+    def _content_to_params(self, content) -> List[Dict]:
+        """Convert response content blocks back into request params"""
+        params = []
+        for block in content:
+            if block.type == "text":
+                params.append({"type": "text", "text": block.text})
+            elif block.type == "tool_use":
+                params.append({"type": "tool_use", "id": block.id, "name": block.name, "input": block.input})
+        return params
     
     # Tool implementations
-    def _tool_read_file(self, file_path: str) -> str:
-        return self.file_ops.read_file(file_path)
+    @tool
+    def _tool_read_file(self, file_path: str, start_line: Optional[int] = None, end_line: Optional[int] = None,
+                        start_byte: Optional[int] = None, end_byte: Optional[int] = None,
+                        cursor: Optional[str] = None) -> str:
+        """Read contents of a file; large files come back one page at a time
+        
+        Args:
+            file_path: Path to the file to read
+            start_line: First line to read (1-based)
+            end_line: Last line to read (inclusive)
+            start_byte: First byte to read
+            end_byte: Byte to stop before
+            cursor: Continuation cursor from a previous page
+        """
+        return self.file_ops.read_file(file_path, start_line, end_line, start_byte, end_byte, cursor)
     
+    @tool
     def _tool_write_file(self, file_path: str, content: str) -> str:
+        """Write content to a file
+        
+        Args:
+            file_path: Path to the file to write
+            content: Content to write to the file
+        """
         return self.file_ops.write_file(file_path, content)
     
+    @tool
     def _tool_list_files(self, directory: str = ".") -> str:
+        """List files in a directory
+        
+        Args:
+            directory: Directory path
+        """
         return self.file_ops.list_files(directory)
     
+    @tool
     def _tool_create_directory(self, directory_path: str) -> str:
+        """Create a directory, including missing parents
+        
+        Args:
+            directory_path: Directory to create
+        """
         return self.file_ops.create_directory(directory_path)
     
-    def _tool_run_command(self, command: str) -> str:
-        return self.file_ops.run_command(command)
+    @tool
+    async def _tool_run_command(self, command: str) -> str:
+        """Run a system command
+        
+        Args:
+            command: Command to run
+        """
+        return await self.file_ops.run_command_async(command)
     
+    @tool
     def _tool_search_files(self, pattern: str, directory: str = ".") -> str:
+        """Search files under a directory for a text pattern
+        
+        Args:
+            pattern: Case-insensitive text to look for
+            directory: Directory to search
+        """
         return self.file_ops.search_files(pattern, directory)
     
+    @tool
     def _tool_analyze_code(self, file_path: str) -> str:
+        """Analyze a code file for common issues and best practices
+        
+        Args:
+            file_path: Path to the code file
+        """
         return self.file_ops.analyze_code(file_path)
     
+    @tool
     def _tool_cost_check(self) -> str:
+        """Report today's API usage, cost and remaining budget"""
         usage = self.model_selector.daily_usage
         return f"""💰 Cost Report:
 Daily Usage: ${usage['cost']:.4f} / ${self.config_manager.config.max_daily_spend:.2f}
 Requests Today: {usage['requests']}
+Tokens Today: {usage.get('input_tokens', 0)} input, {usage.get('output_tokens', 0)} output
+Prompt Cache Today: {usage.get('cache_read_tokens', 0)} tokens read, {usage.get('cache_write_tokens', 0)} written
 Budget Remaining: ${self.config_manager.config.max_daily_spend - usage['cost']:.4f}
-Date: {usage['date']}"""
+Date: {usage['date']}""" + self._cache_report() + self._cascade_report() + self._hedge_report()
+    
+    def _cache_report(self) -> str:
+        """Response cache counters for the cost report"""
+        if not self.response_cache:
+            return ""
+        stats = self.response_cache.stats()
+        return (f"\nResponse Cache: {stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_rate']:.0%}), {stats['entries']} entries")
+    
+    def _hedge_report(self) -> str:
+        """Hedged request counters for the cost report"""
+        if not self.config_manager.config.hedging_enabled:
+            return ""
+        stats = self.hedge_policy.stats()
+        return (f"\nHedging: {stats['hedges_launched']} of {stats['requests']} requests hedged, "
+                f"{stats['hedges_won']} won, ${stats['extra_cost']:.4f} extra")
     
+    def _cascade_report(self) -> str:
+        """Per task type cascade escalation rates for the cost report"""
+        lines = [
+            f"\nCascade [{task}]: {stats['requests']} turns, {stats['escalation_rate']:.0%} escalated, "
+            f"{stats['accepted_latency']:.2f}s accepted / {stats['escalated_latency']:.2f}s escalated"
+            for task, stats in self.model_selector.cascade_stats().items()
+        ]
+        return "".join(lines)
+    
+    @tool
     def _tool_swarm_status(self) -> str:
+        """Check whether the Argus swarm is configured and available"""
         argus_path = self.config_manager.config.argus_path
         if not argus_path:
             return "❌ Argus swarm not configured. Set ARGUS_PATH environment variable."
@@ -310,10 +726,57 @@ Available MCP Servers: {len(mcp_servers)}
 Status: ⚠️ Not currently running
 To activate: Run MCP servers and orchestrator"""
     
+    @tool
     async def _tool_get_memory(self, session_id: str = "default") -> str:
+        """Get the most recent messages from a conversation session
+        
+        Args:
+            session_id: Session to read
+        """
         memory = await self.memory_manager.get_conversation_history(session_id)
         return json.dumps(memory[-3:], indent=2)
     
+    @tool
+    async def _tool_search_memory(self, query: str, limit: int = 10) -> str:
+        """Full-text search past conversations and saved artifacts, best matches first
+        
+        Args:
+            query: Words to find; end a word with * to match it as a prefix
+            limit: Most results to return
+        """
+        results = await self.memory_manager.search(query, max(1, min(limit, 50)))
+        return format_search_results(query, results)
+    
+    @tool
+    async def _tool_read_artifact_range(self, name: str, offset: int = 0,
+                                        length: int = ARTIFACT_PAGE_CHARS) -> str:
+        """Read part of a stored artifact, such as a spilled tool output
+        
+        Args:
+            name: Artifact name or handle
+            offset: Character offset to start at
+            length: Number of characters to read
+        """
+        length = max(1, min(length, ARTIFACT_PAGE_CHARS))
+        page = await self.memory_manager.read_artifact_range(name, max(offset, 0), length)
+        if page is None:
+            return f"❌ Artifact not found: {name}"
+        
+        text, total = page
+        end = max(offset, 0) + len(text)
+        footer = f"\n\n[characters {max(offset, 0)}-{end} of {total}"
+        if end < total:
+            footer += f"; continue with offset={end}"
+        return text + footer + "]"
+    
+    @tool
     async def _tool_save_artifact(self, name: str, content: str, category: str = "general") -> str:
+        """Save a named artifact to long-term memory
+        
+        Args:
+            name: Unique artifact name
+            content: Artifact content
+            category: Artifact category
+        """
         await self.memory_manager.save_artifact(name, content, category)
         return f"Artifact '{name}' saved successfully"
\ No newline at end of file
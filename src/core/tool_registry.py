@@ -0,0 +1,212 @@
+# src/core/tool_registry.py
+import asyncio
+import functools
+import inspect
+import logging
+import typing
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Python annotation -> (JSON schema type, isinstance check)
+_JSON_TYPES = {
+    str: ("string", str),
+    int: ("integer", int),
+    float: ("number", (int, float)),
+    bool: ("boolean", bool),
+    list: ("array", list),
+    dict: ("object", dict),
+}
+
+
+class ToolArgumentError(ValueError):
+    """Raised when tool arguments don't match the tool's signature"""
+
+
+@dataclass
+class ToolSpec:
+    """A registered tool: schema, validator and the function to dispatch to"""
+    name: str
+    description: str
+    func: Callable
+    schema: Dict[str, Any]
+    validate: Callable[[Dict[str, Any]], Dict[str, Any]]
+    is_async: bool
+
+
+def _json_type(annotation) -> tuple:
+    """Map a type hint to (JSON schema type, isinstance check)"""
+    origin = typing.get_origin(annotation)
+    if origin is typing.Union:
+        # Optional[X] -> X
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            return _json_type(args[0])
+        return None, object
+    if origin is not None:
+        annotation = origin
+    return _JSON_TYPES.get(annotation, (None, object))
+
+
+def _parse_docstring(func: Callable) -> tuple:
+    """Split a docstring into a summary and an Args: section"""
+    doc = inspect.getdoc(func) or ""
+    summary_lines, arg_docs = [], {}
+    in_args = False
+
+    for line in doc.splitlines():
+        stripped = line.strip()
+        if stripped == "Args:":
+            in_args = True
+        elif in_args and ":" in stripped:
+            name, text = stripped.split(":", 1)
+            arg_docs[name.strip()] = text.strip()
+        elif not in_args and stripped:
+            summary_lines.append(stripped)
+
+    return " ".join(summary_lines), arg_docs
+
+
+def _build_validator(name: str, checks: Dict[str, Any], required: frozenset) -> Callable:
+    """Precompile an argument validator for one tool"""
+    allowed = frozenset(checks)
+
+    def validate(args: Dict[str, Any]) -> Dict[str, Any]:
+        if not isinstance(args, dict):
+            raise ToolArgumentError(f"{name}: arguments must be an object")
+
+        missing = required - args.keys()
+        if missing:
+            raise ToolArgumentError(f"{name}: missing required argument(s): {', '.join(sorted(missing))}")
+
+        unknown = args.keys() - allowed
+        if unknown:
+            raise ToolArgumentError(f"{name}: unknown argument(s): {', '.join(sorted(unknown))}")
+
+        for key, value in args.items():
+            expected = checks[key]
+            if value is None or expected is object:
+                continue
+            if not isinstance(value, expected) or (isinstance(value, bool) and expected is int):
+                raise ToolArgumentError(f"{name}: argument '{key}' has the wrong type")
+
+        return args
+
+    return validate
+
+
+class ToolRegistry:
+    """Tool registry built once from decorated function signatures"""
+
+    def __init__(self):
+        self._tools: Dict[str, ToolSpec] = {}
+        self._schemas: Optional[List[Dict[str, Any]]] = None
+
+    def tool(self, func: Optional[Callable] = None, *, name: Optional[str] = None):
+        """Register a tool. Usable as @tool or @tool(name=...).
+
+        The tool name defaults to the function name without its _tool_
+        prefix; the description and argument docs come from the docstring.
+        """
+        def register(func: Callable) -> Callable:
+            self.register(func, name)
+            return func
+
+        if func is not None:
+            return register(func)
+        return register
+
+    def register(self, func: Callable, name: Optional[str] = None) -> ToolSpec:
+        """Build the schema and validator for a function and register it"""
+        tool_name = name or func.__name__
+        if tool_name.startswith("_tool_"):
+            tool_name = tool_name[len("_tool_"):]
+
+        description, arg_docs = _parse_docstring(func)
+        hints = typing.get_type_hints(func)
+
+        properties, checks, required = {}, {}, []
+        for param in inspect.signature(func).parameters.values():
+            if param.name == "self" or param.kind in (param.VAR_POSITIONAL, param.VAR_KEYWORD):
+                continue
+
+            json_type, check = _json_type(hints.get(param.name, Any))
+            prop: Dict[str, Any] = {}
+            if json_type:
+                prop["type"] = json_type
+            if param.name in arg_docs:
+                prop["description"] = arg_docs[param.name]
+
+            if param.default is param.empty:
+                required.append(param.name)
+            elif param.default is not None:
+                prop["default"] = param.default
+
+            properties[param.name] = prop
+            checks[param.name] = check
+
+        schema = {"type": "object", "properties": properties}
+        if required:
+            schema["required"] = required
+
+        spec = ToolSpec(
+            name=tool_name,
+            description=description or tool_name,
+            func=func,
+            schema=schema,
+            validate=_build_validator(tool_name, checks, frozenset(required)),
+            is_async=asyncio.iscoroutinefunction(func)
+        )
+        self._tools[tool_name] = spec
+        self._schemas = None
+        return spec
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._tools
+
+    def get(self, name: str) -> Optional[ToolSpec]:
+        """Get a tool spec by name"""
+        return self._tools.get(name)
+
+    def names(self) -> List[str]:
+        """Registered tool names"""
+        return list(self._tools)
+
+    def schemas(self) -> List[Dict[str, Any]]:
+        """API tool definitions, built once and reused for every request.
+
+        The cache breakpoint on the last tool lets the provider serve the
+        whole tools array from its prompt cache.
+        """
+        if self._schemas is None:
+            schemas = [
+                {"name": spec.name, "description": spec.description, "input_schema": spec.schema}
+                for spec in self._tools.values()
+            ]
+            if schemas:
+                schemas[-1]["cache_control"] = {"type": "ephemeral"}
+            self._schemas = schemas
+        return self._schemas
+
+    async def dispatch(self, owner: Any, name: str, args: Optional[Dict[str, Any]] = None) -> Any:
+        """Validate arguments and run a tool bound to owner.
+
+        Blocking tools are offloaded to the default executor so they
+        don't stall the event loop.
+        """
+        spec = self._tools.get(name)
+        if spec is None:
+            raise KeyError(f"Unknown tool: {name}")
+
+        args = spec.validate(args or {})
+        if spec.is_async:
+            return await spec.func(owner, **args)
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(spec.func, owner, **args))
+
+
+# Process-wide registry; ThorClient's tools register here at import time
+tool_registry = ToolRegistry()
+tool = tool_registry.tool
@@ -8,6 +8,7 @@ import threading
 from datetime import datetime
 
 from .thor_client import ThorClient
+from .attachments import attach_files
 
 class ThorUIBridge:
     """Bridge between SwiftUI frontend and Python THOR backend"""
@@ -72,17 +73,8 @@ class ThorUIBridge:
         message = data.get("message", "")
         attachments = data.get("attachments", [])
         
-        # Process attachments
-        processed_message = message
-        for attachment in attachments:
-            file_path = attachment.get("path")
-            if file_path:
-                try:
-                    with open(file_path, 'r') as f:
-                        content = f.read()
-                    processed_message += f"\n\nFile: {file_path}\n```\n{content}\n```"
-                except Exception as e:
-                    processed_message += f"\n\nError reading file {file_path}: {e}"
+        # Attachments are stored once and referenced from the message
+        processed_message = await attach_files(self.thor_client.memory_manager, message, attachments)
         
         # Send to THOR
         response = await self.thor_client.chat(processed_message, session_id)
@@ -126,13 +118,9 @@ class ThorUIBridge:
         tool_name = data.get("tool_name")
         tool_args = data.get("args", {})
         
-        if hasattr(self.thor_client, f"_tool_{tool_name}"):
-            tool_func = getattr(self.thor_client, f"_tool_{tool_name}")
+        if tool_name in self.thor_client.tool_registry:
             try:
-                if asyncio.iscoroutinefunction(tool_func):
-                    result = await tool_func(**tool_args)
-                else:
-                    result = tool_func(**tool_args)
+                result = await self.thor_client.call_tool(tool_name, tool_args)
                 
                 return {
                     "type": "tool_result",
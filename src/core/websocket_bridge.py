@@ -12,6 +12,10 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from core.api_key_manager import APIKeyManager
+from core.api_transport import close_async_clients
+from core.storage import close_databases
+from core.metrics import metrics
+from core.attachments import attach_files
 
 class ThorWebSocketBridge:
     """Working WebSocket bridge for THOR UI"""
@@ -90,7 +94,7 @@ class ThorWebSocketBridge:
                 try:
                     self.logger.info(f"📥 Received message: {message[:200]}...")
                     data = json.loads(message)
-                    response = await self.process_message(data)
+                    response = await self.process_message(data, websocket)
                     await self.send_message(websocket, response)
                 except json.JSONDecodeError as e:
                     self.logger.error(f"JSON decode error: {e}")
@@ -106,7 +110,7 @@ class ThorWebSocketBridge:
         finally:
             self.connected_clients.discard(websocket)
     
-    async def process_message(self, data):
+    async def process_message(self, data, websocket=None):
         """Process incoming messages"""
         message_type = data.get("type", "unknown")
         self.logger.info(f"🔄 Processing message type: {message_type}")
@@ -117,11 +121,15 @@ class ThorWebSocketBridge:
             elif message_type == "get_api_key_status":
                 return await self.handle_get_api_key_status()
             elif message_type == "chat":
-                return await self.handle_chat_message(data)
+                return await self.handle_chat_message(data, websocket)
             elif message_type == "tool":
                 return await self.handle_tool_call(data)
             elif message_type == "cost_check":
                 return await self.handle_cost_check()
+            elif message_type == "metrics":
+                return await self.handle_metrics()
+            elif message_type == "search":
+                return await self.handle_search(data)
             else:
                 return self.create_response("error", error=f"Unknown message type: {message_type}")
                 
@@ -186,8 +194,8 @@ class ThorWebSocketBridge:
             api_key_source="environment" if os.getenv('ANTHROPIC_API_KEY') else "file" if api_key else "none"
         )
     
-    async def handle_chat_message(self, data):
-        """Handle chat messages"""
+    async def handle_chat_message(self, data, websocket=None):
+        """Handle chat messages, streaming chat_delta frames when connected"""
         if not self.thor_client:
             self.logger.warning("❌ Chat attempt without THOR initialized")
             return self.create_response("error", error="THOR not initialized. Please set API key first.")
@@ -201,22 +209,16 @@ class ThorWebSocketBridge:
         try:
             self.logger.info(f"💬 Processing chat: '{message[:50]}...'")
             
-            # Process attachments if any
+            # Attachments are stored once and referenced from the message
             attachments = data.get("attachments", [])
-            processed_message = message
-            
-            for attachment in attachments:
-                file_path = attachment.get("path", "")
-                if file_path and os.path.exists(file_path):
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-                        processed_message += f"\n\nFile: {file_path}\n```\n{content}\n```"
-                    except Exception as e:
-                        processed_message += f"\n\nError reading {file_path}: {str(e)}"
+            processed_message = await attach_files(self.thor_client.memory_manager, message, attachments)
             
             # Send to THOR
-            response = await self.thor_client.chat(processed_message, session_id)
+            pinned = bool(data.get("pinned", False))
+            if websocket is not None and data.get("stream", True):
+                response = await self.stream_chat(websocket, processed_message, session_id, pinned)
+            else:
+                response = await self.thor_client.chat(processed_message, session_id, pinned=pinned)
             
             self.logger.info(f"✅ THOR response: '{response[:50]}...'")
             
@@ -230,6 +232,25 @@ class ThorWebSocketBridge:
             self.logger.error(f"❌ Chat processing error: {e}")
             return self.create_response("error", error=f"Chat failed: {str(e)}")
     
+    async def stream_chat(self, websocket, message, session_id, pinned=False):
+        """Forward streamed chat events to the client as chat_delta frames"""
+        response = ""
+        
+        async for event in self.thor_client.chat_stream(message, session_id, pinned=pinned):
+            if event["type"] == "done":
+                response = event["response"]
+                continue
+            
+            fields = {key: value for key, value in event.items() if key != "type"}
+            await self.send_message(websocket, self.create_response(
+                "chat_delta",
+                session_id=session_id,
+                event=event["type"],
+                **fields
+            ))
+        
+        return response
+    
     async def handle_tool_call(self, data):
         """Handle tool calls"""
         if not self.thor_client:
@@ -241,33 +262,16 @@ class ThorWebSocketBridge:
         try:
             self.logger.info(f"🔧 Running tool: {tool_name}")
             
-            # Tool mapping
-            tool_map = {
-                "list_files": self.thor_client._tool_list_files,
-                "read_file": self.thor_client._tool_read_file,
-                "write_file": self.thor_client._tool_write_file,
-                "run_command": self.thor_client._tool_run_command,
-                "analyze_code": self.thor_client._tool_analyze_code,
-                "search_files": self.thor_client._tool_search_files,
-                "cost_check": self.thor_client._tool_cost_check,
-                "swarm_status": self.thor_client._tool_swarm_status
-            }
-            
-            if tool_name in tool_map:
-                tool_func = tool_map[tool_name]
-                
-                if asyncio.iscoroutinefunction(tool_func):
-                    result = await tool_func(**tool_args)
-                else:
-                    result = tool_func(**tool_args)
-                
-                return self.create_response(
-                    "tool_result",
-                    tool_name=tool_name,
-                    result=result
-                )
-            else:
+            if tool_name not in self.thor_client.tool_registry:
                 return self.create_response("error", error=f"Unknown tool: {tool_name}")
+            
+            result = await self.thor_client.call_tool(tool_name, tool_args)
+            
+            return self.create_response(
+                "tool_result",
+                tool_name=tool_name,
+                result=result
+            )
                 
         except Exception as e:
             self.logger.error(f"❌ Tool error: {e}")
@@ -287,19 +291,42 @@ class ThorWebSocketBridge:
         try:
             cost_info = self.thor_client._tool_cost_check()
             usage = self.thor_client.model_selector.daily_usage
+            cache = self.thor_client.response_cache
             
             return self.create_response(
                 "cost_update",
                 daily_usage=usage.get("cost", 0.0),
                 daily_requests=usage.get("requests", 0),
                 daily_budget=self.thor_client.config_manager.config.max_daily_spend,
-                cost_report=cost_info
+                cost_report=cost_info,
+                response_cache=cache.stats() if cache else None,
+                hedging=self.thor_client.hedge_policy.stats()
             )
             
         except Exception as e:
             self.logger.error(f"❌ Cost check error: {e}")
             return self.create_response("error", error=f"Cost check failed: {str(e)}")
     
+    async def handle_metrics(self):
+        """Handle metrics request: span histograms and the Prometheus text"""
+        return self.create_response(
+            "metrics",
+            histograms=metrics.snapshot(),
+            exposition=metrics.render_prometheus()
+        )
+    
+    async def handle_search(self, data):
+        """Handle memory search: ranked conversation and artifact matches with snippets"""
+        if not self.thor_client:
+            return self.create_response("error", error="THOR not initialized. Please set API key first.")
+        
+        query = data.get("query", "").strip()
+        if not query:
+            return self.create_response("error", error="Search query is required")
+        
+        results = await self.thor_client.memory_manager.search(query, int(data.get("limit", 10)))
+        return self.create_response("search_results", query=query, results=results)
+    
     def create_response(self, response_type, **kwargs):
         """Create standardized response"""
         response = {
@@ -314,7 +341,8 @@ class ThorWebSocketBridge:
         try:
             message = json.dumps(data, default=str)
             await websocket.send(message)
-            self.logger.info(f"📤 Sent: {data.get('type', 'unknown')}")
+            if data.get("type") != "chat_delta":
+                self.logger.info(f"📤 Sent: {data.get('type', 'unknown')}")
         except Exception as e:
             self.logger.error(f"❌ Send error: {e}")
     
@@ -348,6 +376,9 @@ async def main():
         print("\n🛑 Shutting down...")
     except Exception as e:
         print(f"❌ Server error: {e}")
+    finally:
+        await close_async_clients()
+        await close_databases()
 
 if __name__ == "__main__":
     asyncio.run(main())
\ No newline at end of file
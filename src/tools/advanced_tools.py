@@ -474,8 +474,8 @@
                 task_type = task.get("type")
                 task_args = task.get("args", {})
                 
-                if task_type in self.client.tools_registry:
-                    result = await self.client.tools_registry[task_type](**task_args)
+                if task_type in self.client.tool_registry:
+                    result = await self.client.call_tool(task_type, task_args)
                     return {"task": task, "result": result, "success": True}
                 else:
                     return {"task": task, "error": f"Unknown task type: {task_type}", "success": False}
@@ -1,6 +1,7 @@
 # thor/src/utils/artifact_manager.py
 import json
 import os
+import re
 from typing import Dict, Any, Optional, List
 from datetime import datetime
 from pathlib import Path
@@ -83,14 +84,13 @@ class ArtifactManager:
     
     def search_artifacts(self, query: str) -> List[Dict[str, Any]]:
         """Search artifacts by name or content"""
-        results = []
+        # Case-insensitive match without making a lowercased copy of every artifact
+        pattern = re.compile(re.escape(query), re.IGNORECASE)
         
-        for artifact in self.artifacts.values():
-            if (query.lower() in artifact["name"].lower() or 
-                query.lower() in artifact["content"].lower()):
-                results.append(artifact)
-        
-        return results
+        return [
+            artifact for artifact in self.artifacts.values()
+            if pattern.search(artifact["name"]) or pattern.search(artifact["content"])
+        ]
     
     def export_artifact(self, artifact_id: str, filepath: str) -> bool:
         """Export artifact to file"""
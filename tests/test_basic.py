@@ -1,6 +1,8 @@
 # tests/test_basic.py
 import pytest
 import asyncio
+import json
+import sqlite3
 from pathlib import Path
 import sys
 
@@ -9,7 +11,12 @@ sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
 
 from core.config import ConfigManager, ModelConfig
 from core.model_selector import ModelSelector
-from core.file_operations import FileOperations
+from core.model_telemetry import ModelTelemetry
+from core.file_operations import DEFAULT_PAGE_BYTES, FileOperations
+from core.tool_registry import ToolRegistry, ToolArgumentError
+from core.context_builder import ContextBuilder
+from core.response_cache import ResponseCache
+from core.storage import close_databases
 
 def test_config_manager():
     """Test configuration management"""
@@ -28,6 +35,17 @@ def test_model_config():
     assert model.name == "claude-3-sonnet-20240229"
     assert model.cost_per_1k_tokens == 0.003
 
+def test_cost_breakdown():
+    """Test per-direction pricing from token usage"""
+    selector = ModelSelector(ConfigManager("test_config.json"))
+    input_cost, output_cost = selector.cost_breakdown("sonnet-4", {
+        "input_tokens": 1000,
+        "output_tokens": 1000,
+        "cache_read_input_tokens": 10000
+    })
+    assert input_cost == pytest.approx(0.003 + 0.003)
+    assert output_cost == pytest.approx(0.015)
+
 def test_file_operations():
     """Test file operations"""
     file_ops = FileOperations()
@@ -47,5 +65,199 @@ def test_file_operations():
     # Cleanup
     Path("test_file.txt").unlink(missing_ok=True)
 
+def test_tool_registry():
+    """Test schema generation and argument validation"""
+    registry = ToolRegistry()
+    
+    class Owner:
+        @registry.tool
+        def _tool_greet(self, name: str, times: int = 1) -> str:
+            """Greet someone
+            
+            Args:
+                name: Who to greet
+            """
+            return " ".join([f"hi {name}"] * times)
+    
+    schema = registry.schemas()[0]
+    assert schema["name"] == "greet"
+    assert schema["description"] == "Greet someone"
+    assert schema["input_schema"]["required"] == ["name"]
+    assert schema["input_schema"]["properties"]["times"] == {"type": "integer", "default": 1}
+    
+    assert asyncio.run(registry.dispatch(Owner(), "greet", {"name": "thor", "times": 2})) == "hi thor hi thor"
+    for bad_args in ({}, {"name": 1}, {"name": "thor", "extra": True}):
+        with pytest.raises(ToolArgumentError):
+            asyncio.run(registry.dispatch(Owner(), "greet", bad_args))
+
+def test_context_builder():
+    """Test token-budgeted history packing"""
+    model = ModelConfig(name="test", cost_per_1k_tokens=0.001, max_tokens=1000, best_for=[])
+    builder = ContextBuilder()
+    history = [
+        {"role": "user", "content": "pinned question", "pinned": True},
+        {"role": "assistant", "content": "x" * 2000},
+        {"role": "user", "content": "recent question"},
+        {"role": "assistant", "content": "recent answer"},
+    ]
+    
+    messages = builder.build(history, "new question", model, budget=100)
+    
+    # The oversized middle message is dropped; pinned and newest are kept,
+    # and the two user turns that end up adjacent are merged
+    assert [m["role"] for m in messages] == ["user", "assistant", "user"]
+    assert messages[0]["content"] == "pinned question\n\nrecent question"
+    assert messages[-1]["content"] == "new question"
+    assert all("pinned" not in m for m in messages)
+    
+    # Leading assistant turns are dropped so the request starts with the user
+    messages = builder.build(history[1:2] + history[2:], "new question", model, budget=20)
+    assert messages[0]["role"] == "user"
+
+def test_response_cache_eviction(tmp_path):
+    """Test TTL expiry and size-bounded LRU eviction"""
+    cache = ResponseCache(str(tmp_path / "cache.db"), max_bytes=120)
+    
+    asyncio.run(cache.put("a", {"text": "x" * 40}))
+    asyncio.run(cache.put("b", {"text": "y" * 40}))
+    assert asyncio.run(cache.get("a")) is not None  # a is now most recent
+    asyncio.run(cache.put("c", {"text": "z" * 40}))
+    
+    assert asyncio.run(cache.get("b")) is None
+    assert asyncio.run(cache.get("a")) is not None
+    
+    cache.ttl_seconds = 0
+    assert asyncio.run(cache.get("c")) is None
+    
+    # Running totals match what's stored
+    cache.ttl_seconds = 3600
+    asyncio.run(cache.put("c", {"text": "z" * 40}))
+    stats = cache.stats()
+    asyncio.run(close_databases())
+    conn = sqlite3.connect(tmp_path / "cache.db")
+    assert conn.execute("SELECT COUNT(*), SUM(size) FROM responses").fetchone() == (stats["entries"], stats["bytes"])
+    conn.close()
+
+def test_latency_slo_routing(tmp_path, monkeypatch):
+    """Test SLO-based choice of the cheapest fast-enough model and error failover"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager("test_config.json")
+    config.config.latency_slos = {"general": 2.0}
+    selector = ModelSelector(config)
+    
+    # Haiku is unmeasured, so it's tried first; once measured too slow, sonnet is next
+    assert selector.choose_model("general")[0] == "haiku-4"
+    for _ in range(5):
+        selector.telemetry.record("haiku-4", "general", 5.0, output_tokens=100)
+        selector.telemetry.record("sonnet-4", "general", 1.0, output_tokens=100)
+    assert selector.choose_model("general")[0] == "sonnet-4"
+    assert selector.telemetry.stats("sonnet-4", "general")["p95"] == 1.0
+    
+    # Selectors in one process share telemetry; it survives a restart once flushed
+    assert ModelSelector(config).telemetry is selector.telemetry
+    selector.telemetry.flush()
+    assert ModelTelemetry(selector.telemetry.path).stats("haiku-4", "general")["samples"] == 5
+    
+    # A burst of errors takes sonnet out of rotation for coding
+    for _ in range(10):
+        selector.telemetry.record("sonnet-4", "coding", 30.0, error=True)
+    assert selector.choose_model("coding")[0] == "opus-4"
+
+def test_context_builder_expands_attachments_once():
+    """Test each file version is expanded once and superseded versions are elided"""
+    builder = ContextBuilder()
+    model = ModelConfig(name="m", cost_per_1k_tokens=0.0, max_tokens=100000, best_for=[])
+    v1, v2 = "a" * 64, "b" * 64
+    history = [
+        {"role": "user", "content": f"look\n\n[[attachment:{v1} app.py]]"},
+        {"role": "assistant", "content": "ok"},
+        {"role": "user", "content": f"again\n\n[[attachment:{v2} app.py]]"},
+        {"role": "assistant", "content": "ok"}
+    ]
+    messages = builder.build(history, f"once more\n\n[[attachment:{v2} app.py]]", model,
+                             attachments={v1: "print(1)", v2: "print(2)"})
+    
+    text = "\n".join(msg["content"] for msg in messages)
+    assert "print(1)" not in text
+    assert text.count("print(2)") == 1
+    assert "print(2)" in messages[-1]["content"]
+    assert "older version elided" in messages[0]["content"]
+    assert "unchanged" in messages[2]["content"]
+
+def test_read_file_pages(tmp_path):
+    """Test ranged reads and following cursors through a memory-mapped file"""
+    file_ops = FileOperations()
+    path = tmp_path / "big.log"
+    lines = [f"line {i} é\n" for i in range(1, 150001)]
+    path.write_text("".join(lines), encoding="utf-8")
+    
+    page = file_ops.read_file(str(path), start_line=10, end_line=12)
+    assert page.startswith("line 10 é\nline 11 é\nline 12 é\n\n\n[lines 10-12 of")
+    assert "cursor=" not in page
+    
+    # Follow line cursors to the end; every line comes back exactly once
+    text, cursor = "", None
+    while True:
+        page = file_ops.read_file(str(path), start_line=1 if cursor is None else None, cursor=cursor)
+        body, _, footer = page.rpartition("\n\n[")
+        text += body
+        if 'cursor="' not in footer:
+            break
+        cursor = footer.split('cursor="')[1].split('"')[0]
+    assert text == "".join(lines)
+    
+    # Line cursors carry the byte offset to resume from; a bare line number still works
+    assert cursor.startswith("line:") and "@" in cursor
+    line = int(cursor[len("line:"):cursor.index("@")])
+    assert file_ops.read_file(str(path), cursor=cursor) == file_ops.read_file(str(path), cursor=f"line:{line}")
+    
+    # Byte pages never split a multi-byte character
+    page = file_ops.read_file(str(path), start_byte=0, end_byte=12)
+    assert page.startswith("line 1 é\nli")
+    assert 'cursor="byte:12-12"' not in page
+    page = file_ops.read_file(str(path), start_byte=8, end_byte=20)
+    assert page.startswith("\nline 2 é")
+
+def test_read_file_cursors_continue_past_a_long_line(tmp_path):
+    """Test that cursors page through a line longer than a page and on to the next lines"""
+    file_ops = FileOperations()
+    path = tmp_path / "minified.txt"
+    lines = ["first\n", "é" * 150 + "\n", "third\n", "last\n"]
+    path.write_text("".join(lines), encoding="utf-8")
+    
+    text, cursor, pages = "", None, 0
+    while True:
+        page = file_ops.read_file(str(path), start_line=1 if cursor is None else None, cursor=cursor,
+                                  page_bytes=100)
+        body, _, footer = page.rpartition("\n\n[")
+        text += body
+        pages += 1
+        if 'cursor="' not in footer:
+            break
+        cursor = footer.split('cursor="')[1].split('"')[0]
+    assert text == "".join(lines)
+    assert pages > 3
+    
+    # A line range stops at its end even when it finishes on a long line
+    page = file_ops.read_file(str(path), start_line=2, end_line=2, page_bytes=100)
+    while 'cursor="' in page:
+        cursor = page.split('cursor="')[1].split('"')[0]
+        assert "line:" not in cursor
+        page = file_ops.read_file(str(path), cursor=cursor, page_bytes=100)
+    assert page.rpartition("\n\n[")[0].endswith("\n")
+
+def test_analyze_code_reads_the_whole_file(tmp_path):
+    """Test that code analysis isn't cut off at read_file's page size"""
+    file_ops = FileOperations()
+    path = tmp_path / "big.py"
+    source = "".join(f"def func_{i}():\n    return {i}\n\n" for i in range(5000))
+    path.write_text(source, encoding="utf-8")
+    assert len(source) > DEFAULT_PAGE_BYTES
+    
+    analysis = json.loads(file_ops.analyze_code(str(path)))
+    assert analysis["size"] == len(source)
+    assert analysis["lines"] == len(source.splitlines())
+    assert not any(issue.startswith("Syntax error") for issue in analysis["issues"])
+
 if __name__ == "__main__":
-    pytest.main([__file__])
\ No newline at end of file
+    pytest.main([__file__])
@@ -0,0 +1,90 @@
+# tests/test_batch_runner.py
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.batch_runner import BatchRunner, BatchTransport
+from core.config import ConfigManager
+from core.model_selector import ModelSelector
+
+
+class FakeTransport(BatchTransport):
+    """In-memory batches API that ends each batch after a few polls"""
+
+    def __init__(self, polls_until_done=2):
+        self.polls_until_done = polls_until_done
+        self.batches = {}
+        self.polls = 0
+
+    async def create(self, requests):
+        batch_id = f"batch_{len(self.batches) + 1}"
+        self.batches[batch_id] = requests
+        return batch_id
+
+    async def retrieve(self, batch_id):
+        self.polls += 1
+        status = "ended" if self.polls >= self.polls_until_done else "in_progress"
+        return {"id": batch_id, "status": status}
+
+    async def results(self, batch_id):
+        for request in self.batches[batch_id]:
+            prompt = request["params"]["messages"][0]["content"]
+            yield {
+                "custom_id": request["custom_id"],
+                "type": "succeeded",
+                "text": prompt.upper(),
+                "usage": {"input_tokens": 1000, "output_tokens": 1000}
+            }
+
+
+@pytest.fixture
+def selector(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return ModelSelector(ConfigManager(str(tmp_path / "thor_config.json")))
+
+
+def write_prompts(path, prompts):
+    path.write_text("".join(json.dumps({"prompt": p}) + "\n" for p in prompts))
+
+
+def test_batch_run_writes_results_at_batch_price(tmp_path, selector):
+    prompts = tmp_path / "prompts.jsonl"
+    output = tmp_path / "results.jsonl"
+    write_prompts(prompts, ["one", "two"])
+    runner = BatchRunner(FakeTransport(), selector, poll_interval=0.01)
+
+    counts = asyncio.run(runner.run(str(prompts), str(output)))
+
+    assert counts == {"succeeded": 2}
+    results = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["text"] for r in results] == ["ONE", "TWO"]
+    # sonnet: (1k in * $0.003 + 1k out * $0.015) at half price
+    assert results[0]["cost"] == pytest.approx(0.009)
+    assert selector.daily_usage["cost"] == pytest.approx(0.018)
+
+
+def test_batch_run_resumes_without_resubmitting(tmp_path, selector):
+    prompts = tmp_path / "prompts.jsonl"
+    output = tmp_path / "results.jsonl"
+    write_prompts(prompts, ["one", "two"])
+    transport = FakeTransport(polls_until_done=10)
+    runner = BatchRunner(transport, selector, poll_interval=0.01, max_poll_interval=0.01)
+
+    async def interrupted():
+        await asyncio.wait_for(runner.run(str(prompts), str(output)), timeout=0.05)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(interrupted())
+    assert len(transport.batches) == 1
+
+    counts = asyncio.run(runner.run(str(prompts), str(output)))
+
+    assert counts == {"succeeded": 2}
+    assert len(transport.batches) == 1
+    assert len(output.read_text().splitlines()) == 2
@@ -0,0 +1,879 @@
+# tests/test_thor_client.py
+import asyncio
+import io
+import json
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import anthropic
+import pytest
+from rich.console import Console
+
+# Add src to path
+sys.path.insert(0, str(Path(__file__).parent.parent / "src"))
+
+from core.api_transport import get_async_client
+from core.attachments import attach_files
+from core.config import ConfigManager
+from core.memory_manager import MemoryManager
+from core.memory_schema import MIGRATIONS
+from core.metrics import metrics
+from core.rate_limiter import RateLimiter
+from core.response_cache import ResponseCache
+from core.storage import close_databases, open_database
+from core.terminal_renderer import TerminalRenderer
+from core.thor_client import ThorClient
+
+
+def text_delta(text):
+    return SimpleNamespace(
+        type="content_block_delta",
+        delta=SimpleNamespace(type="text_delta", text=text)
+    )
+
+
+def text_block(text):
+    return SimpleNamespace(type="text", text=text)
+
+
+def tool_block(tool_id, tool_name, **tool_input):
+    return SimpleNamespace(type="tool_use", id=tool_id, name=tool_name, input=tool_input)
+
+
+def message(*blocks, stop_reason="end_turn"):
+    return SimpleNamespace(stop_reason=stop_reason, content=list(blocks))
+
+
+class FakeStream:
+    """Async context manager mimicking messages.stream()"""
+
+    def __init__(self, owner, final_message):
+        self.owner = owner
+        self.final_message = final_message
+
+    async def __aenter__(self):
+        if self.owner.delays:
+            await asyncio.sleep(self.owner.delays.pop(0))
+        self.owner.in_flight += 1
+        self.owner.max_in_flight = max(self.owner.max_in_flight, self.owner.in_flight)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.owner.in_flight -= 1
+
+    async def __aiter__(self):
+        yield SimpleNamespace(type="message_start")
+        for block in self.final_message.content:
+            yield SimpleNamespace(type="content_block_start")
+            if block.type == "text":
+                for chunk in block.text:
+                    await asyncio.sleep(0.01)
+                    yield text_delta(chunk)
+            else:
+                # Tool input streams as JSON, not text
+                await asyncio.sleep(self.owner.tool_input_delay)
+
+    async def get_final_message(self):
+        return self.final_message
+
+
+class FakeMessages:
+    """Stand-in for client.messages that replays scripted responses"""
+
+    def __init__(self, *script):
+        self.script = list(script) or [message(text_block("ok"))]
+        self.requests = []
+        self.failures = []
+        self.delays = []
+        self.tool_input_delay = 0.0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def stream(self, **kwargs):
+        self.requests.append(kwargs)
+        if self.failures:
+            raise self.failures.pop(0)
+        response = self.script[min(len(self.requests), len(self.script)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return FakeStream(self, response)
+
+
+@pytest.fixture
+def thor(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "sk-ant-test-key")
+    client = ThorClient(str(tmp_path / "thor_config.json"))
+    client.client = SimpleNamespace(messages=FakeMessages())
+    asyncio.run(client.initialize())
+    yield client
+    asyncio.run(close_databases())
+
+
+def test_shared_async_client():
+    """Same API key reuses one client and connection pool"""
+    assert get_async_client("sk-ant-a") is get_async_client("sk-ant-a")
+    assert get_async_client("sk-ant-a") is not get_async_client("sk-ant-b")
+
+
+def test_concurrent_chats_overlap(thor):
+    """Chats from different sessions don't serialize on the API call"""
+    async def run():
+        return await asyncio.gather(
+            thor.chat("hello from a", "session-a"),
+            thor.chat("hello from b", "session-b")
+        )
+
+    responses = asyncio.run(run())
+    assert responses == ["ok", "ok"]
+    assert thor.client.messages.max_in_flight == 2
+
+
+def test_chat_stream_yields_deltas(thor):
+    """Text arrives incrementally before the final done event"""
+    async def run():
+        return [event async for event in thor.chat_stream("hello")]
+
+    events = asyncio.run(run())
+    assert [e["text"] for e in events if e["type"] == "text_delta"] == ["o", "k"]
+    assert events[-1]["type"] == "done"
+    assert events[-1]["response"] == "ok"
+
+
+def test_agent_loop_feeds_tool_results_back(thor, tmp_path):
+    """Tool calls in one response run together and results go back to the model"""
+    (tmp_path / "a.txt").write_text("alpha")
+    (tmp_path / "b.txt").write_text("beta")
+    thor.client.messages = FakeMessages(
+        message(
+            tool_block("t1", "read_file", file_path="a.txt"),
+            tool_block("t2", "read_file", file_path="b.txt"),
+            stop_reason="tool_use"
+        ),
+        message(text_block("done"))
+    )
+
+    response = asyncio.run(thor.chat("read both files"))
+
+    assert response == "done"
+    followup = thor.client.messages.requests[1]["messages"]
+    assert followup[-2]["role"] == "assistant"
+    results = {r["tool_use_id"]: r["content"] for r in followup[-1]["content"]}
+    assert results == {"t1": "alpha", "t2": "beta"}
+
+
+def test_agent_loop_step_limit(thor):
+    """A model that never stops calling tools is cut off at max_agent_steps"""
+    thor.config_manager.config.max_agent_steps = 2
+    thor.client.messages = FakeMessages(
+        message(tool_block("t1", "list_files"), stop_reason="tool_use")
+    )
+
+    response = asyncio.run(thor.chat("loop forever"))
+
+    assert len(thor.client.messages.requests) == 2
+    assert "Stopped after 2 tool steps" in response
+
+
+def test_last_step_tool_calls_are_not_run(thor, monkeypatch):
+    """Tools requested on the final allowed step are skipped, not run unseen"""
+    thor.config_manager.config.max_agent_steps = 1
+    thor.client.messages = FakeMessages(
+        message(tool_block("t1", "write_file", file_path="x.txt", content="x"), stop_reason="tool_use")
+    )
+    calls = []
+
+    async def handle_tool_call(name, tool_input):
+        calls.append(name)
+        return "ok", False
+    monkeypatch.setattr(thor, "_handle_tool_call", handle_tool_call)
+
+    async def run():
+        return [event async for event in thor.chat_stream("write it")]
+
+    events = asyncio.run(run())
+
+    assert calls == []
+    assert not [e for e in events if e["type"] in ("tool_use", "tool_result")]
+    assert "skipped: write_file" in events[-1]["response"]
+
+
+def test_prompt_cache_breakpoints(thor):
+    """Stable system prefix and tools are cacheable, per-request data is not"""
+    thor.client.messages = FakeMessages(SimpleNamespace(
+        stop_reason="end_turn",
+        content=[text_block("ok")],
+        usage=SimpleNamespace(input_tokens=10, output_tokens=2,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=900)
+    ))
+
+    async def run():
+        return [event async for event in thor.chat_stream("hello")]
+
+    done = asyncio.run(run())[-1]
+    request = thor.client.messages.requests[0]
+    stable, dynamic = request["system"]
+    assert stable["cache_control"] == {"type": "ephemeral"}
+    assert "Current session" not in stable["text"]
+    assert "cache_control" not in dynamic
+    assert "cache_control" in request["tools"][-1]
+    assert done["usage"]["cache_read_input_tokens"] == 900
+    assert thor.model_selector.daily_usage["cache_read_tokens"] == 900
+
+
+def test_usage_ledger_records_tokens_per_message(thor):
+    """Token counts and costs come from response usage, not string lengths"""
+    thor.client.messages = FakeMessages(SimpleNamespace(
+        stop_reason="end_turn",
+        content=[text_block("ok")],
+        usage=SimpleNamespace(input_tokens=1000, output_tokens=200,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0)
+    ))
+
+    asyncio.run(thor.chat("hello", "ledger"))
+
+    conn = sqlite3.connect(thor.memory_manager.db_path)
+    rows = conn.execute(
+        "SELECT role, tokens, cost FROM conversations WHERE session_id = 'ledger' ORDER BY id"
+    ).fetchall()
+    conn.close()
+    assert [(role, tokens) for role, tokens, _ in rows] == [("user", 1000), ("assistant", 200)]
+    assert rows[0][2] == pytest.approx(0.003)
+    assert rows[1][2] == pytest.approx(0.003)
+    assert thor.model_selector.daily_usage["cost"] == pytest.approx(0.006)
+
+
+def test_usage_is_billed_when_a_later_step_fails(thor):
+    """Tokens from earlier agent steps reach the ledger even if the turn errors"""
+    thor.client.messages = FakeMessages(
+        SimpleNamespace(
+            stop_reason="tool_use",
+            content=[tool_block("t1", "list_files")],
+            usage=SimpleNamespace(input_tokens=100000, output_tokens=0,
+                                  cache_creation_input_tokens=0, cache_read_input_tokens=0)
+        ),
+        RuntimeError("upstream went away")
+    )
+
+    response = asyncio.run(thor.chat("list everything"))
+
+    assert response.startswith("❌ API Error")
+    assert thor.model_selector.daily_usage["input_tokens"] == 100000
+    assert thor.model_selector.daily_usage["cost"] == pytest.approx(0.3)
+
+
+def test_response_cache_serves_repeats(thor, tmp_path):
+    """Identical requests are answered from the cache without an API call"""
+    thor.response_cache = ResponseCache(str(tmp_path / "cache.db"))
+
+    first = asyncio.run(thor.chat("analyze this", "run-1"))
+    second = asyncio.run(thor.chat("analyze this", "run-2"))
+
+    assert first == second == "ok"
+    assert len(thor.client.messages.requests) == 1
+    assert thor.response_cache.stats()["hits"] == 1
+    assert "Response Cache: 1 hits, 1 misses" in thor._tool_cost_check()
+
+
+def test_identical_requests_coalesce(thor):
+    """Concurrent identical prompts share one upstream stream"""
+    thor.client.messages = FakeMessages(SimpleNamespace(
+        stop_reason="end_turn",
+        content=[text_block("shared")],
+        usage=SimpleNamespace(input_tokens=1000, output_tokens=0,
+                              cache_creation_input_tokens=0, cache_read_input_tokens=0)
+    ))
+
+    async def run():
+        return await asyncio.gather(*(thor.chat("review this", f"client-{i}") for i in range(3)))
+
+    assert asyncio.run(run()) == ["shared"] * 3
+    assert len(thor.client.messages.requests) == 1
+    assert thor.model_selector.daily_usage["cost"] == pytest.approx(0.003)
+
+
+class Overloaded(anthropic.APIStatusError):
+    """A 529 without needing a real HTTP response"""
+
+    def __init__(self, retry_after="0"):
+        self.status_code = 529
+        self.response = SimpleNamespace(headers={"retry-after": retry_after})
+
+
+def test_overload_is_retried_and_shrinks_window(thor):
+    """529s back off, halve the concurrency window and then succeed"""
+    thor.rate_limiter = RateLimiter(100, 100000, max_concurrency=4, backoff_base=0.001)
+    thor.client.messages.failures = [Overloaded(), Overloaded()]
+
+    response = asyncio.run(thor.chat("hello"))
+
+    assert response == "ok"
+    assert len(thor.client.messages.requests) == 3
+    window = thor.rate_limiter._for_model(thor.model_selector.config.model_configs["sonnet-4"].name)[2]
+    assert window.limit == 2  # 4 -> 2 -> 1, then +1 for the success
+
+
+def test_cancelled_turn_closes_stream_and_rolls_back(thor):
+    """Cancelling mid-turn closes the HTTP stream and leaves memory untouched"""
+    thor.client.messages = FakeMessages(
+        message(
+            tool_block("t1", "save_artifact", name="notes", content="draft"),
+            stop_reason="tool_use"
+        ),
+        message(text_block("x" * 500))
+    )
+
+    async def run():
+        turn = asyncio.ensure_future(thor.chat("take notes", "cancel-me"))
+        while len(thor.client.messages.requests) < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        turn.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await turn
+
+    asyncio.run(run())
+
+    assert thor.client.messages.in_flight == 0
+    assert asyncio.run(thor.memory_manager.get_artifact("notes")) is None
+    assert asyncio.run(thor.memory_manager.get_conversation_history("cancel-me")) == []
+    conn = sqlite3.connect(thor.memory_manager.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM artifacts").fetchone()[0] == 0
+    conn.close()
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="process groups are POSIX only")
+def test_cancelled_command_kills_process_group(thor, tmp_path):
+    """A cancelled run_command takes its child processes down with it"""
+    pid_file = tmp_path / "child.pid"
+    command = (
+        "python -c \"import subprocess, time; "
+        "p = subprocess.Popen(['sleep', '30']); "
+        f"open(r'{pid_file}', 'w').write(str(p.pid)); time.sleep(30)\""
+    )
+
+    async def run():
+        task = asyncio.ensure_future(thor.file_ops.run_command_async(command))
+        while not pid_file.exists() or not pid_file.read_text():
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+
+    child = Path(f"/proc/{pid_file.read_text()}/status")
+    for _ in range(100):
+        # Gone, or a zombie waiting for init to reap it
+        if not child.exists() or "\nState:\tZ" in child.read_text():
+            break
+        time.sleep(0.02)
+    else:
+        pytest.fail("child process survived cancellation")
+
+
+def test_terminal_renderer_shows_markdown_and_timings(thor):
+    """Streamed text is rendered with a per-phase status line from the done event"""
+    console = Console(file=io.StringIO(), width=80, force_terminal=False)
+
+    async def run():
+        async with TerminalRenderer(console=console, refresh_per_second=50) as renderer:
+            async for event in thor.chat_stream("hello"):
+                renderer.handle(event)
+        return renderer
+
+    renderer = asyncio.run(run())
+
+    assert set(renderer.result["timings"]) == {"api", "tools", "memory"}
+    assert renderer.result["timings"]["api"] > 0
+    output = console.file.getvalue()
+    assert "ok" in output
+    assert "api " in output and "memory " in output
+
+
+def test_terminal_renderer_prints_a_tall_answer_once(thor):
+    """An answer taller than the terminal is redrawn in place, then printed once"""
+    console = Console(file=io.StringIO(), width=80, height=10, force_terminal=True)
+    answer = "\n\n".join(f"line number {n}" for n in range(40))
+
+    async def run():
+        async with TerminalRenderer(console=console, refresh_per_second=50) as renderer:
+            for paragraph in answer.split("\n\n"):
+                renderer.handle({"type": "text_delta", "text": paragraph + "\n\n"})
+                await asyncio.sleep(0.02)
+            renderer.handle({"type": "done", "response": answer})
+
+    asyncio.run(run())
+
+    # Live frames are separated by the erase-lines sequence that rewinds them
+    *frames, final = re.split(r"\r?(?:\x1b\[2K\x1b\[1A)*\x1b\[2K", console.file.getvalue())
+    assert max(frame.count("\n") for frame in frames) < console.height
+    assert final.count("line number 0 ") == 1
+    assert "line number 39" in final
+
+
+def test_cascade_keeps_confident_fast_answer(thor):
+    """A confident fast-model answer is used as is, without its marker"""
+    thor.config_manager.config.cascade_enabled = True
+    thor.client.messages = FakeMessages(message(text_block("Paris<confidence>0.9</confidence>")))
+
+    async def run():
+        return [event async for event in thor.chat_stream("capital of France?")]
+
+    events = asyncio.run(run())
+
+    requests = thor.client.messages.requests
+    assert [r["model"] for r in requests] == ["claude-3-haiku-20240307"]
+    assert "<confidence>" in requests[0]["system"][1]["text"]
+    assert [e["text"] for e in events if e["type"] == "text_delta"] == ["Paris"]
+    assert events[-1]["response"] == "Paris"
+    stats = thor.model_selector.cascade_stats()["general"]
+    assert stats["requests"] == 1 and stats["escalation_rate"] == 0.0
+
+
+def test_cascade_escalates_unsure_answer(thor):
+    """Low confidence re-issues the same step on the task's model"""
+    thor.config_manager.config.cascade_enabled = True
+    thor.client.messages = FakeMessages(
+        message(text_block("Maybe?<confidence>0.2</confidence>")),
+        message(text_block("Definitely"))
+    )
+
+    response = asyncio.run(thor.chat("capital of France?"))
+
+    requests = thor.client.messages.requests
+    assert [r["model"] for r in requests] == ["claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"]
+    assert requests[1]["messages"] == requests[0]["messages"]
+    assert "<confidence>" not in requests[1]["system"][1]["text"]
+    assert response == "Definitely"
+    assert thor.model_selector.cascade_stats()["general"]["escalation_rate"] == 1.0
+
+
+def test_cascade_judges_the_answer_after_tool_steps(thor, tmp_path):
+    """Fast-model tool steps don't end the cascade; an unsure final answer still escalates"""
+    (tmp_path / "a.txt").write_text("alpha")
+    thor.config_manager.config.cascade_enabled = True
+    thor.client.messages = FakeMessages(
+        message(
+            text_block("let me look"),
+            tool_block("t1", "read_file", file_path="a.txt"),
+            stop_reason="tool_use"
+        ),
+        message(text_block("I have no idea<confidence>0.1</confidence>")),
+        message(text_block("It says alpha"))
+    )
+
+    response = asyncio.run(thor.chat("what's in a.txt?"))
+
+    requests = thor.client.messages.requests
+    assert [r["model"] for r in requests] == [
+        "claude-3-haiku-20240307", "claude-3-haiku-20240307", "claude-3-5-sonnet-20241022"
+    ]
+    assert "<confidence>" in requests[1]["system"][1]["text"]
+    assert requests[2]["messages"] == requests[1]["messages"]
+    assert response == "let me look\nIt says alpha"
+    assert thor.model_selector.cascade_stats()["general"]["escalation_rate"] == 1.0
+
+
+def test_slow_request_is_hedged(thor):
+    """A call slow to start is raced by a duplicate and the loser is cancelled"""
+    thor.config_manager.config.hedging_enabled = True
+    thor.hedge_policy.max_fraction = 1.0
+    for _ in range(5):
+        thor.model_selector.telemetry.record("sonnet-4", "general", 0.5, first_token=0.01)
+    thor.client.messages.delays = [5.0, 0.0]
+    requests_before = thor.model_selector.daily_usage["requests"]
+
+    async def run():
+        started = time.perf_counter()
+        response = await thor.chat("hello")
+        return response, time.perf_counter() - started
+
+    response, elapsed = asyncio.run(run())
+
+    assert response == "ok"
+    assert elapsed < 2.0
+    assert len(thor.client.messages.requests) == 2
+    stats = thor.hedge_policy.stats()
+    assert stats["hedges_launched"] == 1 and stats["hedges_won"] == 1
+    assert stats["extra_cost"] > 0
+    # The loser's cost is billed, but it's still one request
+    assert thor.model_selector.daily_usage["requests"] == requests_before + 1
+
+
+def test_tool_call_counts_as_first_token(thor):
+    """A response that opens with a tool call isn't hedged as if it hadn't started"""
+    thor.config_manager.config.hedging_enabled = True
+    thor.hedge_policy.max_fraction = 1.0
+    for _ in range(5):
+        thor.model_selector.telemetry.record("sonnet-4", "general", 0.5, first_token=0.01)
+    thor.client.messages = FakeMessages(
+        message(tool_block("t1", "list_files"), stop_reason="tool_use"),
+        message(text_block("done"))
+    )
+    thor.client.messages.tool_input_delay = 0.5
+
+    assert asyncio.run(thor.chat("hello")) == "done"
+    assert len(thor.client.messages.requests) == 2
+    assert thor.hedge_policy.stats()["hedges_launched"] == 0
+
+
+def test_turn_spans_reach_metrics_endpoint(thor, tmp_path):
+    """Each phase of a turn is timed and exposed as Prometheus text and JSON lines"""
+    (tmp_path / "a.txt").write_text("alpha")
+    thor.client.messages = FakeMessages(
+        message(tool_block("t1", "read_file", file_path="a.txt"), stop_reason="tool_use"),
+        message(text_block("done"))
+    )
+    metrics.dump_to(str(tmp_path / "spans.jsonl"))
+
+    async def run():
+        await thor.chat("read a file")
+        server = await metrics.start_server("127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write(b"GET /metrics HTTP/1.1\r\nHost: localhost\r\n\r\n")
+            body = await reader.read()
+            writer.close()
+        finally:
+            await metrics.stop_server()
+        return body.decode()
+
+    try:
+        body = asyncio.run(run())
+    finally:
+        metrics.dump_to(None)
+
+    assert body.startswith("HTTP/1.1 200 OK")
+    for span in ("classification", "history_fetch", "context_build", "upstream_ttfb",
+                 "upstream_total", "memory_write"):
+        assert f'thor_span_seconds_count{{span="{span}"' in body
+    assert 'span="tool",tool="read_file"' in body
+
+    dumped = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+    assert {"span": "tool", "tool": "read_file"}.items() <= next(d for d in dumped if d["span"] == "tool").items()
+
+
+def test_attachments_are_stored_once_and_referenced(thor, tmp_path):
+    """Re-attaching a file stores it once and sends its content once per request"""
+    (tmp_path / "big.py").write_text("x = 1\n" * 500)
+
+    async def run():
+        for _ in range(3):
+            message = await attach_files(thor.memory_manager, "check this", [{"path": "big.py"}])
+            await thor.chat(message, "attach")
+
+    asyncio.run(run())
+
+    conn = sqlite3.connect(thor.memory_manager.db_path)
+    assert conn.execute("SELECT COUNT(*) FROM attachments").fetchone()[0] == 1
+    stored = [row[0] for row in conn.execute("SELECT content FROM conversations WHERE role = 'user'")]
+    conn.close()
+    assert all("x = 1" not in content and "[[attachment:" in content for content in stored)
+
+    last_request = json.dumps(thor.client.messages.requests[-1]["messages"])
+    assert last_request.count("x = 1") == 500
+
+
+def test_large_tool_output_is_spilled_to_an_artifact(thor):
+    """Oversized tool results reach the model as head, tail and a pageable handle"""
+    thor.config_manager.config.tool_output_limit = 1000
+    thor.client.messages = FakeMessages(
+        message(
+            tool_block("t1", "run_command", command="python -c \"print('ab' * 5000)\""),
+            stop_reason="tool_use"
+        ),
+        message(text_block("done"))
+    )
+
+    asyncio.run(thor.chat("dump something big"))
+
+    sent = thor.client.messages.requests[1]["messages"][-1]["content"][0]["content"]
+    assert len(sent) < 1000
+    handle = sent.split("is artifact '")[1].split("'")[0]
+
+    async def page_through():
+        text, offset = "", 0
+        while True:
+            page = await thor.call_tool("read_artifact_range", {"name": handle, "offset": offset, "length": 4000})
+            body, _, footer = page.rpartition("\n\n[")
+            text += body
+            if "continue with offset=" not in footer:
+                return text
+            offset = int(footer.split("offset=")[1].rstrip("]"))
+
+    assert asyncio.run(page_through()) == "ab" * 5000 + "\n"
+
+
+def test_memory_database_uses_wal_and_shared_connections(thor):
+    """Memory goes through one shared writer and reader pool in WAL mode"""
+    async def run():
+        db = await open_database(thor.memory_manager.db_path)
+        mode = await db.fetchone("PRAGMA journal_mode")
+        readers = await asyncio.gather(*(
+            thor.memory_manager.get_artifact(f"missing-{i}") for i in range(8)
+        ))
+        await thor.memory_manager.save_artifact("notes", "written off the event loop")
+        return db, mode, readers
+
+    db, mode, readers = asyncio.run(run())
+    assert db is thor.memory_manager.db
+    assert mode == ("wal",)
+    assert readers == [None] * 8
+    assert len(db.readers) == thor.config_manager.config.db_readers
+
+    # Other processes sharing the file see committed writes
+    conn = sqlite3.connect(thor.memory_manager.db_path)
+    assert conn.execute("SELECT content FROM artifacts WHERE name = 'notes'").fetchone() == (
+        "written off the event loop",
+    )
+    conn.close()
+
+
+def test_existing_memory_database_is_migrated_in_place(tmp_path, monkeypatch):
+    """An unversioned thor_memory.db keeps its rows and gains the indexes"""
+    monkeypatch.chdir(tmp_path)
+    conn = sqlite3.connect("thor_memory.db")
+    conn.execute(MIGRATIONS[0][0])
+    conn.execute(MIGRATIONS[0][1])
+    conn.execute("INSERT INTO conversations (session_id, role, content) VALUES ('old', 'user', 'still here')")
+    conn.commit()
+    conn.close()
+
+    memory = MemoryManager(ConfigManager(str(tmp_path / "thor_config.json")))
+    try:
+        asyncio.run(memory.load_memory())
+        # Running again is a no-op
+        assert asyncio.run(memory.db.migrate(MIGRATIONS)) == len(MIGRATIONS)
+    finally:
+        asyncio.run(close_databases())
+
+    conn = sqlite3.connect("thor_memory.db")
+    assert conn.execute("PRAGMA user_version").fetchone() == (len(MIGRATIONS),)
+    assert conn.execute("SELECT content FROM conversations").fetchall() == [("still here",)]
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT role, content FROM conversations WHERE session_id = ? ORDER BY timestamp",
+        ("old",)
+    ).fetchall()
+    conn.close()
+    assert "idx_conversations_session_time" in str(plan)
+
+
+def test_sessions_load_lazily_and_are_evicted_by_size(tmp_path, monkeypatch):
+    """Startup loads nothing; sessions load on first use, capped by a byte budget"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager(str(tmp_path / "thor_config.json"))
+    config.config.chat_memory_limit = 4
+
+    async def seed():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        for session in ("a", "b", "c"):
+            for turn in range(5):
+                await memory.add_to_conversation(session, f"{session} question {turn}", "x" * 1000)
+
+    async def run():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        resident_at_start = list(memory.conversation_cache)
+        history = await memory.get_conversation_history("a")
+        config.config.session_cache_bytes = memory.session_bytes["a"] * 2
+        await memory.get_conversation_history("b")
+        await memory.get_conversation_history("c")
+        return memory, resident_at_start, history
+
+    try:
+        asyncio.run(seed())
+        memory, resident_at_start, history = asyncio.run(run())
+    finally:
+        asyncio.run(close_databases())
+
+    assert resident_at_start == []
+    assert [msg["content"] for msg in history if msg["role"] == "user"] == ["a question 3", "a question 4"]
+    assert len(history) == 4
+    # "a" was least recently used
+    assert list(memory.conversation_cache) == ["b", "c"]
+
+
+def test_pinned_message_outlives_the_history_limit(tmp_path, monkeypatch):
+    """A pinned turn stays in the history, cached and reloaded, as newer turns push others out"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager(str(tmp_path / "thor_config.json"))
+    config.config.chat_memory_limit = 4
+
+    async def run():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        await memory.add_to_conversation("s", "always answer in French", "d'accord", pinned=True)
+        for turn in range(4):
+            await memory.add_to_conversation("s", f"question {turn}", f"answer {turn}")
+        cached = await memory.get_conversation_history("s")
+        await memory.flush()
+
+        memory.conversation_cache.clear()
+        return cached, await memory.get_conversation_history("s")
+
+    try:
+        cached, reloaded = asyncio.run(run())
+    finally:
+        asyncio.run(close_databases())
+
+    assert cached == reloaded
+    assert cached[0] == {"role": "user", "content": "always answer in French", "pinned": True}
+    assert [msg["content"] for msg in cached[1:]] == ["question 2", "answer 2", "question 3", "answer 3"]
+    assert "d'accord" not in [msg["content"] for msg in cached]
+
+
+def test_old_pinned_message_survives_the_age_cutoff(tmp_path, monkeypatch):
+    """A pinned turn older than the history window is still loaded; unpinned ones aren't"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager(str(tmp_path / "thor_config.json"))
+
+    async def run():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        await memory.add_to_conversation("s", "always answer in French", "d'accord", pinned=True)
+        await memory.add_to_conversation("s", "old question", "old answer")
+        await memory.flush()
+        await memory.db.execute(
+            "UPDATE conversations SET timestamp = datetime('now', '-30 days')"
+        )
+        await memory.add_to_conversation("s", "new question", "new answer")
+        await memory.flush()
+
+        memory.conversation_cache.clear()
+        return await memory.get_conversation_history("s")
+
+    try:
+        history = asyncio.run(run())
+    finally:
+        asyncio.run(close_databases())
+
+    assert [msg["content"] for msg in history] == ["always answer in French", "new question", "new answer"]
+    assert history[0]["pinned"]
+
+
+def test_conversation_writes_are_batched_behind_the_request(tmp_path, monkeypatch):
+    """Turns are cached at once and written in batches: on size, on save_all and on close"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager(str(tmp_path / "thor_config.json"))
+    config.config.memory_flush_interval = 60
+    config.config.memory_flush_rows = 6
+
+    def stored():
+        conn = sqlite3.connect("thor_memory.db")
+        count = conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        conn.close()
+        return count
+
+    async def run():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        await asyncio.gather(*(
+            memory.add_to_conversation(f"session-{i}", f"question {i}", f"answer {i}") for i in range(2)
+        ))
+        queued = stored(), await memory.get_conversation_history("session-1")
+
+        # A third turn reaches memory_flush_rows and wakes the flusher
+        await memory.add_to_conversation("session-2", "question 2", "answer 2")
+        await asyncio.sleep(0.2)
+        after_size_trigger = stored()
+
+        await memory.add_to_conversation("session-3", "question 3", "answer 3")
+        await memory.save_all()
+        after_save_all = stored()
+
+        await memory.add_to_conversation("session-4", "question 4", "answer 4")
+        await close_databases()
+        return queued, after_size_trigger, after_save_all
+
+    try:
+        (count, history), after_size_trigger, after_save_all = asyncio.run(run())
+    finally:
+        asyncio.run(close_databases())
+
+    assert count == 0
+    assert history == [{"role": "user", "content": "question 1"}, {"role": "assistant", "content": "answer 1"}]
+    assert after_size_trigger == 6
+    assert after_save_all == 8
+    assert stored() == 10
+
+
+def test_search_memory_ranks_conversations_and_artifacts(thor):
+    """FTS indexes follow every write and rank matches with snippets"""
+    async def run():
+        memory = thor.memory_manager
+        for i in range(5):
+            await memory.add_to_conversation(f"filler-{i}", f"filler question {i}", "filler answer")
+            await memory.save_artifact(f"filler-{i}", "filler content")
+        await memory.add_to_conversation("deploy", "How do we rotate the postgres credentials?",
+                                         "Rotate them with the vault CLI, then restart the workers.")
+        await memory.add_to_conversation("lunch", "Where should we eat?", "The noodle place.")
+        await memory.save_artifact("runbook", "Old notes about backups")
+        await memory.save_artifact("runbook", "Rotating credentials: run vault rotate, restart workers")
+        await memory.save_artifact("postgres-tuning", "shared_buffers and work_mem")
+        await memory.save_artifact("db-notes", "postgres connection pooling for postgres")
+        return (
+            await memory.search("rotate credentials"),
+            await memory.search("backups"),
+            await memory.search('postgres" (*'),
+            await thor._tool_search_memory("noodl*")
+        )
+
+    rotate, stale, postgres, tool_output = asyncio.run(run())
+
+    assert {(result["type"], result.get("session_id") or result.get("name")) for result in rotate} == {
+        ("conversation", "deploy"), ("artifact", "runbook")
+    }
+    assert all("**" in result["snippet"] for result in rotate)
+    assert rotate == sorted(rotate, key=lambda result: result["score"], reverse=True)
+    # The overwritten artifact text is no longer indexed
+    assert stale == []
+    # Stray quotes and brackets are searched as words, and name matches outrank content matches
+    assert [result["name"] for result in postgres if result["type"] == "artifact"] == ["postgres-tuning", "db-notes"]
+    assert "1. [lunch · assistant · " in tool_output and "**noodle**" in tool_output
+
+
+def test_flush_cancelled_during_commit_is_not_written_twice(tmp_path, monkeypatch):
+    """Rows whose COMMIT was already under way aren't queued again"""
+    monkeypatch.chdir(tmp_path)
+    config = ConfigManager(str(tmp_path / "thor_config.json"))
+    config.config.memory_flush_interval = 60
+
+    async def run():
+        memory = MemoryManager(config)
+        await memory.load_memory()
+        await memory.add_to_conversation("s", "question", "answer")
+
+        writer = memory.db.writer
+        execute = writer.execute
+
+        async def slow_commit(sql, *args):
+            if sql == "COMMIT":
+                await asyncio.sleep(0.2)
+            return await execute(sql, *args)
+
+        monkeypatch.setattr(writer, "execute", slow_commit)
+        flush = asyncio.ensure_future(memory.flush())
+        await asyncio.sleep(0.1)
+        flush.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await flush
+        await asyncio.sleep(0.2)
+
+        await memory.flush()
+        return await memory.db.fetchone("SELECT COUNT(*) FROM conversations"), memory._unflushed
+
+    try:
+        count, unflushed = asyncio.run(run())
+    finally:
+        asyncio.run(close_databases())
+
+    assert count == (2,)
+    assert unflushed == {}
@@ -4,7 +4,6 @@ import sys
 import os
 from pathlib import Path
 import signal
-import threading
 from typing import Optional
 
 # Add src to path for imports
@@ -12,6 +11,11 @@ sys.path.insert(0, str(Path(__file__).parent / "src"))
 
 from core.thor_client import ThorClient
 from core.config import ConfigManager
+from core.memory_manager import MemoryManager, format_search_results
+from core.api_transport import close_async_clients
+from core.storage import close_databases
+from core.batch_runner import AnthropicBatchTransport, BatchRunner
+from core.terminal_renderer import TerminalRenderer
 
 class ThorCLI:
     """Enhanced CLI interface with better signal handling"""
@@ -20,22 +24,62 @@ class ThorCLI:
         self.client: Optional[ThorClient] = None
         self.running = True
         self.session_id = "default"
+        self.current_turn: Optional[asyncio.Task] = None
+        self._turn_cancelled = False
         
     def signal_handler(self, signum, frame):
-        """Handle signals properly"""
-        print(f"\n🛑 Received interrupt signal. Shutting down gracefully...")
+        """Handle SIGTERM while waiting for input"""
+        print(f"\n🛑 Received termination signal. Shutting down gracefully...")
         self.running = False
-        if self.client:
-            self.client.kill_flag.set()
-            self.client.stop_thinking_indicator()
+        raise SystemExit(0)
+    
+    def install_signal_handlers(self):
+        """Ctrl+C raises KeyboardInterrupt at the prompt; SIGTERM shuts down"""
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        signal.signal(signal.SIGTERM, self.signal_handler)
+    
+    def cancel_turn(self, shutdown: bool = False):
+        """Cancel the chat turn in progress"""
+        if shutdown:
+            self.running = False
+        if self.current_turn and not self.current_turn.done():
+            self._turn_cancelled = True
+            self.current_turn.cancel()
+    
+    async def run_turn(self, message: str, pinned: bool = False):
+        """Run one chat turn as a task that Ctrl+C cancels.
         
-        # Force exit after a short delay
-        def force_exit():
-            import time
-            time.sleep(2)
-            os._exit(0)
+        Cancelling closes the HTTP stream, kills tool subprocesses and
+        discards the turn's memory writes; the REPL then carries on.
+        """
+        loop = asyncio.get_running_loop()
+        self.current_turn = asyncio.ensure_future(self.stream_response(message, pinned))
+        self._turn_cancelled = False
         
-        threading.Thread(target=force_exit, daemon=True).start()
+        installed = []
+        for signum, shutdown in ((signal.SIGINT, False), (signal.SIGTERM, True)):
+            try:
+                loop.add_signal_handler(signum, self.cancel_turn, shutdown)
+                installed.append(signum)
+            except (NotImplementedError, RuntimeError):
+                # No loop signal handlers here (e.g. Windows)
+                pass
+        
+        try:
+            await self.current_turn
+            # The REPL blocks the loop in input() next, so the background
+            # flusher wouldn't get to write this turn until the one after
+            await self.client.memory_manager.flush()
+        except asyncio.CancelledError:
+            # The renderer has already shown a cancellation we asked for;
+            # anything else is this task itself being cancelled
+            if not self._turn_cancelled:
+                raise
+        finally:
+            for signum in installed:
+                loop.remove_signal_handler(signum)
+            self.install_signal_handlers()
+            self.current_turn = None
         
     async def initialize(self):
         """Initialize THOR client"""
@@ -46,7 +90,7 @@ class ThorCLI:
             print("✅ THOR initialized successfully!")
             print(f"💰 Budget: ${self.client.config_manager.config.max_daily_spend:.2f}/day")
             print("📘 Type 'help' for available commands, 'quit' to exit")
-            print("🛑 Press Ctrl+C to interrupt long operations")
+            print("🛑 Press Ctrl+C to cancel a running request")
             print("-" * 50)
             
         except Exception as e:
@@ -59,63 +103,71 @@ class ThorCLI:
     async def run_interactive(self):
         """Run interactive mode"""
         # Set up signal handling
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        self.install_signal_handlers()
         
         await self.initialize()
         
-        while self.running:
-            try:
-                # Get user input
-                user_input = input(f"\n🤖 THOR [{self.session_id}]: ").strip()
+        try:
+            while self.running:
+                try:
+                    # Get user input
+                    user_input = input(f"\n🤖 THOR [{self.session_id}]: ").strip()
                 
-                if not user_input or not self.running:
-                    continue
+                    if not user_input or not self.running:
+                        continue
                 
-                # Handle special commands
-                if user_input.lower() in ['quit', 'exit']:
-                    break
-                elif user_input.lower() == 'help':
-                    self.show_help()
-                    continue
-                elif user_input.startswith('session '):
-                    parts = user_input.split(' ', 1)
-                    if len(parts) > 1:
-                        self.session_id = parts[1]
-                        print(f"📝 Switched to session: {self.session_id}")
-                    continue
-                elif user_input.lower() == 'cost':
-                    result = self.client._tool_cost_check()
-                    print(result)
-                    continue
-                elif user_input.lower() == 'clear':
-                    os.system('clear' if os.name == 'posix' else 'cls')
-                    continue
-                elif user_input.lower() == 'status':
-                    result = self.client._tool_swarm_status()
-                    print(result)
-                    continue
+                    # Handle special commands
+                    if user_input.lower() in ['quit', 'exit']:
+                        break
+                    elif user_input.lower() == 'help':
+                        self.show_help()
+                        continue
+                    elif user_input.startswith('session '):
+                        parts = user_input.split(' ', 1)
+                        if len(parts) > 1:
+                            self.session_id = parts[1]
+                            print(f"📝 Switched to session: {self.session_id}")
+                        continue
+                    elif user_input.startswith('pin '):
+                        # Instructions that should hold for the rest of the session
+                        await self.run_turn(user_input[4:].strip(), pinned=True)
+                        continue
+                    elif user_input.lower() == 'cost':
+                        result = self.client._tool_cost_check()
+                        print(result)
+                        continue
+                    elif user_input.lower() == 'clear':
+                        os.system('clear' if os.name == 'posix' else 'cls')
+                        continue
+                    elif user_input.lower() == 'status':
+                        result = self.client._tool_swarm_status()
+                        print(result)
+                        continue
                 
-                # Process with THOR
-                response = await self.client.chat(user_input, self.session_id)
-                print(f"\n{response}")
+                    # Process with THOR
+                    await self.run_turn(user_input)
                 
-            except KeyboardInterrupt:
-                print("\n🛑 Operation interrupted")
-                if self.client:
-                    self.client.kill_flag.set()
-                    self.client.stop_thinking_indicator()
-                continue
-            except EOFError:
-                break
-            except Exception as e:
-                print(f"❌ Error: {e}")
-                continue
+                except KeyboardInterrupt:
+                    print("\n💡 Type 'quit' or press Ctrl+D to exit")
+                    continue
+                except EOFError:
+                    break
+                except Exception as e:
+                    print(f"❌ Error: {e}")
+                    continue
         
-        print("\n👋 Goodbye!")
-        if self.client:
-            self.client.kill_flag.set()
-            self.client.stop_thinking_indicator()
+            print("\n👋 Goodbye!")
+            if self.client:
+                self.client.kill_flag.set()
+        finally:
+            await close_async_clients()
+            await close_databases()
+    
+    async def stream_response(self, message: str, pinned: bool = False):
+        """Render a chat turn as it streams in"""
+        async with TerminalRenderer() as renderer:
+            async for event in self.client.chat_stream(message, self.session_id, pinned=pinned):
+                renderer.handle(event)
     
     def show_help(self):
         """Show help information"""
@@ -129,6 +181,7 @@ BASIC COMMANDS:
   status              - Check swarm status
   clear               - Clear terminal
   session <name>       - Switch to different session
+  pin <message>        - Send a message that stays in context all session
 
 DEVELOPMENT COMMANDS:
   "read file.py"              - Read a file
@@ -143,18 +196,58 @@ EXAMPLES:
   "Optimize my database queries"
   "Help me debug this error"
   
-🛑 Press Ctrl+C to interrupt long operations
+🛑 Press Ctrl+C to cancel a running request
 💡 THOR learns from your coding patterns and preferences
         """)
     
     async def run_single_command(self, command: str):
         """Run single command and exit"""
-        signal.signal(signal.SIGINT, self.signal_handler)
-        signal.signal(signal.SIGTERM, self.signal_handler)
+        self.install_signal_handlers()
         
         await self.initialize()
-        response = await self.client.chat(command, self.session_id)
-        print(response)
+        try:
+            await self.run_turn(command)
+        finally:
+            await close_async_clients()
+            await close_databases()
+
+    async def run_batch(self, args):
+        """Run a prompts file as message batches and write results as JSONL"""
+        self.client = ThorClient()
+        await self.client.initialize()
+        
+        output = args.output or f"{args.input}.results.jsonl"
+        transport = AnthropicBatchTransport(self.client.config_manager.config.api_key, base_url=args.base_url)
+        runner = BatchRunner(
+            transport,
+            self.client.model_selector,
+            system_prompt=self.client.system_prompt,
+            default_model=args.model,
+            max_tokens=args.max_tokens,
+            poll_interval=args.poll_interval,
+            memory_manager=self.client.memory_manager
+        )
+        
+        try:
+            print(f"📦 Submitting {args.input} as message batches...")
+            counts = await runner.run(args.input, output)
+            summary = ", ".join(f"{count} {result_type}" for result_type, count in sorted(counts.items()))
+            print(f"✅ Batch complete: {summary or 'nothing to do'}")
+            print(f"📄 Results: {output}")
+        finally:
+            await transport.close()
+            await close_async_clients()
+            await close_databases()
+
+    async def run_search(self, args):
+        """Search conversation and artifact memory; needs no API key"""
+        memory_manager = MemoryManager(ConfigManager())
+        try:
+            await memory_manager.load_memory()
+            results = await memory_manager.search(args.query, args.limit)
+            print(format_search_results(args.query, results))
+        finally:
+            await close_databases()
 
 def main():
     """Main entry point"""
@@ -163,6 +256,18 @@ def main():
     parser.add_argument("--session", "-s", default="default", help="Session ID")
     parser.add_argument("--config", action="store_true", help="Show configuration")
     
+    subparsers = parser.add_subparsers(dest="subcommand")
+    batch_parser = subparsers.add_parser("batch", help="Run a JSONL file of prompts through the Message Batches API")
+    batch_parser.add_argument("input", help="JSONL file, one {\"prompt\": ...} object per line")
+    batch_parser.add_argument("--output", "-o", help="Results JSONL (default: <input>.results.jsonl)")
+    batch_parser.add_argument("--model", "-m", default="sonnet-4", help="Default model alias")
+    batch_parser.add_argument("--max-tokens", type=int, default=4000, help="Default max output tokens")
+    batch_parser.add_argument("--poll-interval", type=float, default=30.0, help="Initial seconds between status checks")
+    batch_parser.add_argument("--base-url", help="API base URL override, e.g. a local test server")
+    search_parser = subparsers.add_parser("search", help="Full-text search past conversations and artifacts")
+    search_parser.add_argument("query", help="Words to find; end a word with * to match it as a prefix")
+    search_parser.add_argument("--limit", "-n", type=int, default=10, help="Most results to show")
+    
     args = parser.parse_args()
     
     if args.config:
@@ -182,7 +287,11 @@ def main():
     cli.session_id = args.session
     
     try:
-        if args.command:
+        if args.subcommand == "batch":
+            asyncio.run(cli.run_batch(args))
+        elif args.subcommand == "search":
+            asyncio.run(cli.run_search(args))
+        elif args.command:
             asyncio.run(cli.run_single_command(args.command))
         else:
             asyncio.run(cli.run_interactive())